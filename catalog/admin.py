@@ -1,7 +1,7 @@
 """This contains customizations for the models in the Django admin panel."""
 
 from django.contrib import admin
-from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, ActivityType, ProjectType, Client, History
+from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, ActivityType, ProjectType, Client, History, CachedResult, ReviewRun, ResponseBlob, ArchivedResponse, LookupRepair, Category, DomainCategory, ResultChange, RateLimitState, ApiKeyState, ProxyState
 
 
 # Define the admin classes and register models
@@ -61,3 +61,70 @@ class ClientAdmin(admin.ModelAdmin):
 @admin.register(History)
 class HistoryAdmin(admin.ModelAdmin):
     list_display = ('client', 'domain', 'activity_type', 'end_date', 'operator')
+
+
+@admin.register(CachedResult)
+class CachedResultAdmin(admin.ModelAdmin):
+    list_display = ('source', 'key', 'fetched')
+    list_filter = ('source',)
+
+
+@admin.register(ReviewRun)
+class ReviewRunAdmin(admin.ModelAdmin):
+    list_display = ('name', 'started', 'finished', 'checked', 'last_domain', 'shards', 'shards_finished')
+
+
+@admin.register(ArchivedResponse)
+class ArchivedResponseAdmin(admin.ModelAdmin):
+    list_display = ('source', 'key', 'fetched', 'blob')
+    list_filter = ('source',)
+
+
+@admin.register(ResponseBlob)
+class ResponseBlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'size')
+    exclude = ('content',)
+
+
+@admin.register(LookupRepair)
+class LookupRepairAdmin(admin.ModelAdmin):
+    list_display = ('domain', 'source', 'attempts', 'failed', 'next_attempt')
+    list_filter = ('source',)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'blacklisted', 'alias_of')
+    list_filter = ('blacklisted',)
+    list_editable = ('blacklisted',)
+    search_fields = ('name',)
+    exclude = ('normalized',)
+
+
+@admin.register(DomainCategory)
+class DomainCategoryAdmin(admin.ModelAdmin):
+    list_display = ('domain', 'source', 'category')
+    list_filter = ('source',)
+    raw_id_fields = ('domain', 'category')
+
+
+@admin.register(ResultChange)
+class ResultChangeAdmin(admin.ModelAdmin):
+    list_display = ('domain', 'source', 'value', 'changed')
+    list_filter = ('source',)
+    raw_id_fields = ('domain',)
+
+
+@admin.register(RateLimitState)
+class RateLimitStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'tat')
+
+
+@admin.register(ApiKeyState)
+class ApiKeyStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'day', 'used_today', 'paused_until')
+
+
+@admin.register(ProxyState)
+class ProxyStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'cooling_until', 'benched_until', 'captchas')
@@ -0,0 +1,53 @@
+"""This contains the management command to benchmark the reputation source parsers."""
+
+import os
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from modules.parsers import PARSERS
+
+
+# Directory holding the saved source responses
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), 'modules', 'fixtures')
+
+
+class Command(BaseCommand):
+    help = ('Run each reputation source parser against its saved response in modules/fixtures and '
+            'report the parse time and the peak memory allocated by Python while parsing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('parsers', nargs='*', help='Names of the parsers to benchmark (defaults to all)')
+        parser.add_argument('--iterations', type=int, default=200, help='Number of times to parse each fixture')
+        parser.add_argument('--fixtures', default=FIXTURES_DIR, help='Directory containing the saved responses')
+
+    def handle(self, *args, **options):
+        names = options['parsers'] or list(PARSERS)
+        unknown = [name for name in names if name not in PARSERS]
+        if unknown:
+            raise CommandError('Unknown parsers: {}. Choose from: {}'.format(', '.join(unknown), ', '.join(PARSERS)))
+        iterations = max(1, options['iterations'])
+        self.stdout.write('{:<16} {:>10} {:>12} {:>12} {:>12}  {}'.format(
+                          'Parser', 'Size (KB)', 'Mean (ms)', 'Max (ms)', 'Peak (KB)', 'Result'))
+        for name in names:
+            parser = PARSERS[name]
+            with open(os.path.join(options['fixtures'], parser.fixture), 'rb') as fixture:
+                content = fixture.read()
+            # Parse once first so any lazy setup is not counted
+            result = parser.parse(content)
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                parser.parse(content)
+                timings.append(time.perf_counter() - start)
+            # Memory is measured separately because tracing slows down parsing
+            tracemalloc.start()
+            parser.parse(content)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if isinstance(result, dict):
+                result = ', '.join(result)
+            self.stdout.write('{:<16} {:>10.1f} {:>12.3f} {:>12.3f} {:>12.1f}  {}'.format(
+                              name, len(content) / 1024, sum(timings) / len(timings) * 1000, max(timings) * 1000,
+                              peak / 1024, result))
@@ -0,0 +1,149 @@
+"""This contains the management command to benchmark a full domain review against the local stub
+reputation server.
+"""
+
+import os
+import copy
+import math
+import random
+import time
+import tempfile
+import threading
+
+from django.conf import settings
+from django.test.utils import override_settings
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.models import Domain
+from modules.review import DomainReview
+from modules.stub import StubReputationServer, StubProxyServer, SCENARIOS
+from modules.transport import Transport
+from modules.ratelimit import RateScheduler, configured_rate_limits
+from modules.keypool import ApiKeyPool
+from modules.proxies import ProxyPool
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of the provided values."""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, int(math.ceil(percent / 100 * len(values))) - 1)]
+
+
+class TimedDomainReview(DomainReview):
+    """DomainReview that records the latency of every request for each source."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = {}
+        self.latencies_lock = threading.Lock()
+
+    def _request(self, source, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._request(source, method, url, **kwargs)
+        finally:
+            with self.latencies_lock:
+                self.latencies.setdefault(source, []).append(time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    help = ('Review synthetic domains against a local stub of every reputation source and report '
+            'domains per minute, requests per domain, failed lookups, and p50/p99 request latency for each source. '
+            'The configured rate limits are ignored unless --keep-rate-limits is used.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domains', type=int, default=100, help='Number of synthetic domains to review')
+        parser.add_argument('--workers', type=int, help='Domains reviewed at the same time (defaults to max_workers)')
+        parser.add_argument('--sources', nargs='*', help='Names of the sources to check (defaults to every enabled source)')
+        parser.add_argument('--delay', type=float, default=0.05, help='Seconds the stub waits before each normal response')
+        parser.add_argument('--slow-delay', type=float, default=2.0, help='Seconds the stub waits before each slow response')
+        for scenario in SCENARIOS:
+            parser.add_argument('--' + scenario, type=int, default=5,
+                                help='Percent of domains using the {} scenario'.format(scenario))
+        parser.add_argument('--keep-rate-limits', action='store_true', help='Apply the configured rate limits')
+        parser.add_argument('--proxies', type=int, default=0, help='Number of local stand-in proxies for the scraped sources')
+        parser.add_argument('--captcha-proxies', type=int, default=0,
+                            help='Number of the stand-in proxies that make Bluecoat and TrendMicro answer with CAPTCHAs')
+        parser.add_argument('--max-failed-domains', type=float,
+                            help='Fail the run if more than this percent of the domains had a failed lookup')
+
+    def handle(self, *args, **options):
+        # Give each scenario its share of every 100 domains and leave the rest as normal domains
+        mix = []
+        for scenario in SCENARIOS:
+            mix.extend([scenario] * options[scenario])
+        mix.extend(['bench'] * max(0, 100 - len(mix)))
+        # Spread the scenarios out the same way on every run
+        random.Random(0).shuffle(mix)
+        domains = []
+        for number in range(options['domains']):
+            domains.append(Domain(name='{}-{}.example'.format(mix[number % len(mix)], number)))
+
+        config = copy.deepcopy(settings.DOMAINCHECK_CONFIG)
+        config['virustotal_api_key'] = config.get('virustotal_api_key') or 'stub'
+        config['cache_ttl'] = {}
+        if options['workers']:
+            config['max_workers'] = options['workers']
+        workdir = tempfile.mkdtemp()
+        config['malwaredomains_path'] = os.path.join(workdir, 'malwaredomains.txt')
+
+        server = StubReputationServer(delay=options['delay'], slow_delay=options['slow_delay']).start()
+        proxies = []
+        for number in range(options['proxies']):
+            proxies.append(StubProxyServer(captcha=number < options['captcha_proxies']).start())
+        try:
+            with override_settings(DOMAINCHECK_CONFIG=config):
+                review = TimedDomainReview(domains, force_refresh=True, sources=options['sources'])
+                review.transport = Transport(stub_url=server.url)
+                review.session = review.transport.session
+                if options['keep_rate_limits']:
+                    rate_limits = configured_rate_limits()
+                else:
+                    rate_limits = {}
+                    review.scheduler = RateScheduler({})
+                    review.virustotal_keys = ApiKeyPool([config['virustotal_api_key']], rate='1000/s')
+                review.proxy_pool = ProxyPool([proxy.url for proxy in proxies], rate_limits)
+                start = time.perf_counter()
+                reviewed = sum(1 for _ in review.stream_domain_status())
+                elapsed = time.perf_counter() - start
+        finally:
+            server.stop()
+            for proxy in proxies:
+                proxy.stop()
+
+        stats = review.transport.get_stats()
+        total_requests = sum(counts['requests'] for source, counts in stats.items() if source != 'malwaredomains')
+        # Failed lookups finish quickly, so the throughput is only comparable with their count beside it
+        failures = {}
+        for name, key in review.failures:
+            failures[name] = failures.get(name, 0) + 1
+        domain_names = {domain.name for domain in domains}
+        failed_domains = len({key for name, key in review.failures if key in domain_names})
+        self.stdout.write('')
+        self.stdout.write('Reviewed {} of {} domains in {:.1f} seconds with {} workers'.format(
+                          reviewed, len(domains), elapsed, review.max_workers))
+        self.stdout.write('Domains per minute: {:.1f}'.format(reviewed / elapsed * 60 if elapsed else 0))
+        self.stdout.write('Requests per domain: {:.2f}'.format(total_requests / reviewed if reviewed else 0))
+        self.stdout.write('Failed lookups: {}{}'.format(sum(failures.values()), ' ({})'.format(', '.join(
+                          '{} {}'.format(name, count) for name, count in sorted(failures.items()))) if failures else ''))
+        self.stdout.write('Domains with a failed lookup: {} of {}'.format(failed_domains, reviewed))
+        self.stdout.write('')
+        self.stdout.write('{:<16} {:>9} {:>9} {:>10} {:>10} {:>9}'.format('Source', 'Requests', 'Reused', 'p50 (ms)', 'p99 (ms)', 'Failed'))
+        for source, latencies in sorted(review.latencies.items()):
+            counts = stats.get(source, {})
+            failed = len([key for name, key in review.failures if name == source])
+            self.stdout.write('{:<16} {:>9} {:>9} {:>10.1f} {:>10.1f} {:>9}'.format(
+                              source, counts.get('requests', 0), counts.get('reused', 0),
+                              percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, failed))
+        if proxies:
+            self.stdout.write('')
+            self.stdout.write('{:<24} {:>9} {:>9}'.format('Proxy', 'Requests', 'CAPTCHAs'))
+            for proxy in proxies:
+                self.stdout.write('{:<24} {:>9} {:>9}'.format(proxy.url, proxy.requests, 'yes' if proxy.captcha else 'no'))
+        if options['max_failed_domains'] is not None and reviewed:
+            failed_percent = failed_domains / reviewed * 100
+            if failed_percent > options['max_failed_domains']:
+                raise CommandError('{:.1f}% of the domains had a failed lookup, which is more than the {}% allowed by --max-failed-domains'.format(
+                                   failed_percent, options['max_failed_domains']))
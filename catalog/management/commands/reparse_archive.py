@@ -0,0 +1,135 @@
+"""This contains the management command to rebuild domain results from archived source responses."""
+
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.models import Domain
+from tasks import get_domains_to_check, update_domain_health
+from modules.review import DomainReview
+from modules.breaker import NOT_CHECKED
+from modules.blocklist import MalwareDomainList
+from modules.parsers import parse
+from modules.sources import SOURCES
+
+
+class ArchiveDomainReview(DomainReview):
+    """DomainReview that parses each source's newest archived response instead of sending web
+    requests. Sources without an archived response for a domain keep the domain's stored results.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.domains = {}
+        self.missing = set()
+        self.missing_lock = threading.Lock()
+
+    def download_malware_domains(self):
+        """Use the saved copy of the malwaredomains.com list without checking for a new one."""
+        malware_domains = MalwareDomainList()
+        if malware_domains.load():
+            return malware_domains
+        return None
+
+    def stored_result(self, name, key):
+        """Return the stored results of the named source for the domain name or IP address."""
+        with self.missing_lock:
+            self.missing.add((name, key))
+            domain = self.domains.get(key)
+        if name == 'virustotal':
+            return {}
+        if name == 'cymon':
+            # An IP address without an archived response was never checked, so it can't count
+            # as clean
+            self.mark_failed(name, key)
+            return None
+        source = self.sources[name]
+        if domain is None or not source.field:
+            return None
+        value = getattr(domain, source.field)
+        if not value or value == NOT_CHECKED:
+            return []
+        return value.split(', ')
+
+    def run_source(self, name, key):
+        """Parse the newest archived response of the named source for the domain name or IP
+        address. The stored results are used if nothing was archived.
+        """
+        content = self.archive.latest(name, key)
+        if content is None:
+            return self.stored_result(name, key)
+        options = {'resolutions': self.max_resolutions} if name == 'virustotal' else {}
+        try:
+            return parse(name, content, **options)
+        except Exception as error:
+            print('[!] Could not parse the archived {} response for {}: {}'.format(name, key, error))
+            return self.stored_result(name, key)
+
+    def review_domain(self, domain, malware_domains, executor):
+        """Review the domain from its archived responses. The stored values of sources without
+        an archived response are left alone when the results are saved.
+        """
+        with self.missing_lock:
+            self.domains[domain.name] = domain
+        results = super().review_domain(domain, malware_domains, executor)
+        with self.missing_lock:
+            missing = {name for name, key in self.missing if key == domain.name}
+        for name in missing:
+            if name in results['categories']:
+                results['categories'][name] = None
+        if results['health_dns'] == NOT_CHECKED:
+            # One of the domain's IP addresses has no archived response, so keep the passive DNS
+            # health saved by the last full check
+            results['health_dns'] = None
+        if 'virustotal' in missing:
+            # Keep the VirusTotal findings and passive DNS health saved by the last full check
+            results['health_dns'] = None
+            explanations = [explanation for explanation in results['burned_explanation'].split(', ') if explanation]
+            for explanation in (domain.burned_explanation or '').split(', '):
+                if 'VirusTotal' in explanation and explanation not in explanations:
+                    explanations.append(explanation)
+            results['burned_explanation'] = ', '.join(explanations)
+        return results
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the categories and health of domains by parsing the archived source responses '
+            'again, without sending any web requests. Responses are only archived when the '
+            '`archive_responses` setting is enabled. Use this after fixing a source parser.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domains', nargs='*', help='Names of the domains to rebuild (defaults to every domain that is not burned)')
+        parser.add_argument('--sources', nargs='*', help='Names of the sources to parse again (defaults to every enabled source)')
+        parser.add_argument('--dry-run', action='store_true', help='Report the changes without saving them')
+
+    def handle(self, *args, **options):
+        unknown = [name for name in options['sources'] or [] if name not in SOURCES]
+        if unknown:
+            raise CommandError('Unknown sources: {}. Choose from: {}'.format(', '.join(unknown), ', '.join(SOURCES)))
+        if options['domains']:
+            domain_queryset = Domain.objects.filter(name__in=options['domains']).order_by('name')
+        else:
+            domain_queryset = get_domains_to_check()
+        review = ArchiveDomainReview(domain_queryset, force_refresh=True, sources=options['sources'])
+        # Nothing new is archived, so don't purge the responses being parsed
+        review.archive.enabled = False
+        rebuilt = 0
+        changed = 0
+        for domain, results in review.stream_domain_status():
+            rebuilt += 1
+            changes = []
+            for name, source in SOURCES.items():
+                value = results['categories'].get(name)
+                if source.field and value is not None and value != getattr(domain, source.field):
+                    changes.append('{}: "{}" -> "{}"'.format(source.label, getattr(domain, source.field), value))
+            if results['health_dns'] is not None and results['health_dns'] != domain.health_dns:
+                changes.append('DNS health: "{}" -> "{}"'.format(domain.health_dns, results['health_dns']))
+            if results['burned']:
+                changes.append('Burned: {}'.format(results['burned_explanation']))
+            if changes:
+                changed += 1
+                self.stdout.write('{}: {}'.format(domain.name, '; '.join(changes)))
+            if not options['dry_run']:
+                update_domain_health(domain, results, checked=False)
+        self.stdout.write('Rebuilt {} domains from the archive, {} with changes{}'.format(
+                          rebuilt, changed, ' (dry run, nothing was saved)' if options['dry_run'] else ''))
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Name of the reputation source (e.g. talos)', max_length=50, verbose_name='Source')),
+                ('key', models.CharField(help_text='Domain name or IP address that was looked up', max_length=255, verbose_name='Lookup Key')),
+                ('result', models.TextField(help_text='JSON encoded result returned by the source', verbose_name='Result')),
+                ('fetched', models.DateTimeField(help_text='Date and time the result was fetched from the source', verbose_name='Fetched')),
+            ],
+            options={
+                'verbose_name': 'Cached result',
+                'verbose_name_plural': 'Cached results',
+                'ordering': ['source', 'key'],
+                'unique_together': {('source', 'key')},
+            },
+        ),
+    ]
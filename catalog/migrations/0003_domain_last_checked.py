@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_cachedresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domain',
+            name='last_checked',
+            field=models.DateTimeField(blank=True, db_index=True, help_text="Date and time of the domain's last health check", null=True, verbose_name='Last Checked'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_domain_last_checked'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domain',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, help_text="Date and time the current task's lease on this domain expires", null=True, verbose_name='Lease Expiration'),
+        ),
+        migrations.AddField(
+            model_name='domain',
+            name='lease_owner',
+            field=models.CharField(blank=True, help_text='ID of the task currently checking this domain', max_length=64, null=True, verbose_name='Lease Owner'),
+        ),
+    ]
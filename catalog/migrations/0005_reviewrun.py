@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_domain_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name of the run (e.g. the Django Q task group)', max_length=255, unique=True, verbose_name='Name')),
+                ('domain_ids', models.TextField(help_text='JSON encoded list of the IDs of the domains selected for the run', verbose_name='Domain IDs')),
+                ('options', models.TextField(default='{}', help_text='JSON encoded options for the run (e.g. the sources to check)', verbose_name='Options')),
+                ('started', models.DateTimeField(help_text='Date and time the run started', verbose_name='Started')),
+                ('finished', models.DateTimeField(blank=True, help_text='Date and time the run finished', null=True, verbose_name='Finished')),
+                ('checked', models.IntegerField(default=0, help_text='Number of domains reviewed and saved so far', verbose_name='Domains Checked')),
+                ('last_domain', models.CharField(blank=True, help_text='The most recent domain saved by the run', max_length=100, null=True, verbose_name='Last Domain')),
+            ],
+            options={
+                'verbose_name': 'Review run',
+                'verbose_name_plural': 'Review runs',
+                'ordering': ['-started'],
+            },
+        ),
+    ]
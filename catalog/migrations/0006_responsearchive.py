@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_reviewrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-256 digest of the uncompressed response body', max_length=64, unique=True, verbose_name='Digest')),
+                ('content', models.BinaryField(help_text='zlib compressed response body', verbose_name='Content')),
+                ('size', models.IntegerField(help_text='Size of the uncompressed response body in bytes', verbose_name='Size')),
+            ],
+            options={
+                'verbose_name': 'Response blob',
+                'verbose_name_plural': 'Response blobs',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedResponse',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Name of the reputation source (e.g. talos)', max_length=50, verbose_name='Source')),
+                ('key', models.CharField(help_text='Domain name or IP address that was looked up', max_length=255, verbose_name='Lookup Key')),
+                ('fetched', models.DateTimeField(help_text='Date and time the response was fetched from the source', verbose_name='Fetched')),
+                ('blob', models.ForeignKey(help_text='The response body', on_delete=django.db.models.deletion.CASCADE, related_name='responses', to='catalog.ResponseBlob')),
+            ],
+            options={
+                'verbose_name': 'Archived response',
+                'verbose_name_plural': 'Archived responses',
+                'ordering': ['source', 'key', '-fetched'],
+                'index_together': {('source', 'key', 'fetched')},
+            },
+        ),
+    ]
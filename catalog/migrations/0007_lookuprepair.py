@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_responsearchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LookupRepair',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Name of the reputation source (e.g. talos)', max_length=50, verbose_name='Source')),
+                ('attempts', models.IntegerField(default=0, help_text='Number of retries that also failed', verbose_name='Attempts')),
+                ('failed', models.DateTimeField(help_text='Date and time the lookup last failed', verbose_name='Last Failed')),
+                ('next_attempt', models.DateTimeField(db_index=True, help_text='Date and time the lookup may be retried', verbose_name='Next Attempt')),
+                ('domain', models.ForeignKey(help_text='The domain whose lookup failed', on_delete=django.db.models.deletion.CASCADE, related_name='repairs', to='catalog.Domain')),
+            ],
+            options={
+                'verbose_name': 'Lookup repair',
+                'verbose_name_plural': 'Lookup repairs',
+                'ordering': ['next_attempt'],
+                'unique_together': {('domain', 'source')},
+            },
+        ),
+    ]
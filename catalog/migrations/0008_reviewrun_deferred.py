@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_lookuprepair'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewrun',
+            name='deferred',
+            field=models.TextField(default='[]', help_text='JSON encoded list of the domains left for a later run when the time budget ran out', verbose_name='Deferred Domains'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The categories that were hard coded in DomainReview before the blacklist was moved to the database
+BLACKLISTED = ['Phishing', 'Web Ads/Analytics', 'Suspicious', 'Shopping', 'Placeholders',
+               'Pornography', 'Spam', 'Gambling', 'Scam/Questionable/Illegal',
+               'Malicious Sources/Malnets']
+
+# The Domain fields holding each categorizing source's results
+CATEGORY_FIELDS = {
+    'xforce': 'ibm_xforce_cat',
+    'talos': 'talos_cat',
+    'bluecoat': 'bluecoat_cat',
+    'fortiguard': 'fortiguard_cat',
+    'opendns': 'opendns_cat',
+    'trendmicro': 'trendmicro_cat',
+}
+
+
+def normalize(name):
+    return ' '.join(name.split()).lower()
+
+
+def seed_categories(apps, schema_editor):
+    """Add the blacklisted categories and link every domain to its stored categories."""
+    Category = apps.get_model('catalog', 'Category')
+    DomainCategory = apps.get_model('catalog', 'DomainCategory')
+    Domain = apps.get_model('catalog', 'Domain')
+    categories = {}
+    for name in BLACKLISTED:
+        categories[normalize(name)] = Category.objects.create(name=name, normalized=normalize(name), blacklisted=True)
+    links = []
+    for domain in Domain.objects.all().iterator():
+        for source, field in CATEGORY_FIELDS.items():
+            value = getattr(domain, field)
+            if not value or value == 'Not checked':
+                continue
+            for name in set(value.split(', ')):
+                if not name.strip():
+                    continue
+                key = normalize(name)
+                if key not in categories:
+                    categories[key] = Category.objects.create(name=name.strip(), normalized=key)
+                links.append(DomainCategory(domain_id=domain.id, category_id=categories[key].id, source=source))
+    DomainCategory.objects.bulk_create(links, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_reviewrun_deferred'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='The category as it was first returned by a source', max_length=100, verbose_name='Name')),
+                ('normalized', models.CharField(help_text='Lowercase name with single spaces used to match categories', max_length=100, unique=True, verbose_name='Normalized Name')),
+                ('blacklisted', models.BooleanField(db_index=True, default=False, help_text='Domains tagged with this category are flagged as burned', verbose_name='Blacklisted')),
+                ('alias_of', models.ForeignKey(blank=True, help_text='The category this one means the same thing as', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='aliases', to='catalog.Category')),
+            ],
+            options={
+                'verbose_name': 'Category',
+                'verbose_name_plural': 'Categories',
+                'ordering': ['normalized'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DomainCategory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Name of the reputation source (e.g. talos)', max_length=50, verbose_name='Source')),
+                ('category', models.ForeignKey(help_text='The category returned by the source', on_delete=django.db.models.deletion.CASCADE, related_name='domain_links', to='catalog.Category')),
+                ('domain', models.ForeignKey(help_text='The domain that was categorized', on_delete=django.db.models.deletion.CASCADE, related_name='category_links', to='catalog.Domain')),
+            ],
+            options={
+                'verbose_name': 'Domain category',
+                'verbose_name_plural': 'Domain categories',
+                'ordering': ['domain', 'source'],
+                'unique_together': {('domain', 'source', 'category')},
+            },
+        ),
+        migrations.RunPython(seed_categories, migrations.RunPython.noop),
+    ]
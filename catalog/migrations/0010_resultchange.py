@@ -0,0 +1,61 @@
+# Generated by Django 2.2.28 on 2026-10-17 06:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# The Domain fields holding each source's results
+RESULT_FIELDS = {
+    'xforce': 'ibm_xforce_cat',
+    'talos': 'talos_cat',
+    'bluecoat': 'bluecoat_cat',
+    'fortiguard': 'fortiguard_cat',
+    'opendns': 'opendns_cat',
+    'trendmicro': 'trendmicro_cat',
+    'mxtoolbox': 'mx_toolbox_status',
+    'health_dns': 'health_dns',
+}
+
+
+def record_current_results(apps, schema_editor):
+    """Record every domain's stored results as the starting point of its history."""
+    Domain = apps.get_model('catalog', 'Domain')
+    ResultChange = apps.get_model('catalog', 'ResultChange')
+    now = django.utils.timezone.now()
+    changes = []
+    for domain in Domain.objects.select_related('health_status').iterator():
+        changed = domain.last_checked or now
+        results = {source: getattr(domain, field) for source, field in RESULT_FIELDS.items()}
+        results['health_status'] = domain.health_status.health_status if domain.health_status else None
+        for source, value in results.items():
+            if value and value != 'Not checked':
+                changes.append(ResultChange(domain_id=domain.id, source=source, value=value, changed=changed))
+    ResultChange.objects.bulk_create(changes, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_categories'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Name of the reputation source (e.g. talos) or `health_status` or `health_dns`', max_length=50, verbose_name='Source')),
+                ('value', models.TextField(help_text='The new result', verbose_name='Value')),
+                ('changed', models.DateTimeField(db_index=True, help_text='Date and time the new result was saved', verbose_name='Changed')),
+                ('domain', models.ForeignKey(help_text='The domain whose result changed', on_delete=django.db.models.deletion.CASCADE, related_name='result_changes', to='catalog.Domain')),
+            ],
+            options={
+                'verbose_name': 'Result change',
+                'verbose_name_plural': 'Result changes',
+                'ordering': ['-changed'],
+                'index_together': {('domain', 'source', 'changed')},
+            },
+        ),
+        migrations.RunPython(record_current_results, migrations.RunPython.noop),
+    ]
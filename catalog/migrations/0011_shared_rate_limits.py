@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_resultchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name of the bucket (e.g. source:talos)', max_length=100, unique=True, verbose_name='Name')),
+                ('tat', models.FloatField(default=0, help_text='Unix time the next request is allowed at the sustained rate', verbose_name='Next Request Time')),
+            ],
+            options={
+                'verbose_name': 'Rate limit state',
+                'verbose_name_plural': 'Rate limit states',
+                'ordering': ['name'],
+            },
+        ),
+    ]
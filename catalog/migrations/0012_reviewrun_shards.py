@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_shared_rate_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewrun',
+            name='shards',
+            field=models.IntegerField(default=0, help_text='Number of shards queued for the run, if it was split across workers', verbose_name='Shards'),
+        ),
+        migrations.AddField(
+            model_name='reviewrun',
+            name='shards_failed',
+            field=models.IntegerField(default=0, help_text="Number of the run's shards that failed", verbose_name='Shards Failed'),
+        ),
+        migrations.AddField(
+            model_name='reviewrun',
+            name='shards_finished',
+            field=models.IntegerField(default=0, help_text="Number of the run's shards that have finished", verbose_name='Shards Finished'),
+        ),
+    ]
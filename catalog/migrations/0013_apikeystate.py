@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_reviewrun_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiKeyState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name of the key (a hash, so the key itself is never stored)', max_length=100, unique=True, verbose_name='Name')),
+                ('day', models.DateField(blank=True, help_text='The day `used_today` was counted for', null=True, verbose_name='Day')),
+                ('used_today', models.IntegerField(default=0, help_text='Number of requests made with the key on `day`', verbose_name='Used Today')),
+                ('paused_until', models.FloatField(default=0, help_text='Unix time the key may be used again after it was throttled or quarantined', verbose_name='Paused Until')),
+            ],
+            options={
+                'verbose_name': 'API key state',
+                'verbose_name_plural': 'API key states',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_apikeystate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProxyState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name of the proxy and source (e.g. proxy:http://10.0.0.5:3128:bluecoat)', max_length=255, unique=True, verbose_name='Name')),
+                ('cooling_until', models.FloatField(default=0, help_text='Unix time the proxy may be used again after a 429 or 503', verbose_name='Cooling Until')),
+                ('benched_until', models.FloatField(default=0, help_text='Unix time the proxy may be used again after too many CAPTCHAs', verbose_name='Benched Until')),
+                ('captchas', models.IntegerField(default=0, help_text='CAPTCHAs in a row returned through the proxy', verbose_name='CAPTCHAs')),
+            ],
+            options={
+                'verbose_name': 'Proxy state',
+                'verbose_name_plural': 'Proxy states',
+                'ordering': ['name'],
+            },
+        ),
+    ]
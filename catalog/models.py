@@ -124,6 +124,9 @@ class Domain(models.Model):
     mx_toolbox_status =  models.CharField('MX Toolbox Status', max_length=100, help_text='Domain spam status as determined by MX Toolbox', null=True)
     note = models.TextField('Notes', help_text='Domain-related notes, such as thoughts behind its purchase or how/why it was burned or retired', null=True)
     burned_explanation = models.TextField('Health Explanation', help_text='Reasons why the domain\'s health status is not "Healthy"', null=True)
+    last_checked = models.DateTimeField('Last Checked', help_text='Date and time of the domain\'s last health check', null=True, blank=True, db_index=True)
+    lease_owner = models.CharField('Lease Owner', max_length=64, help_text='ID of the task currently checking this domain', null=True, blank=True)
+    lease_expires = models.DateTimeField('Lease Expiration', help_text='Date and time the current task\'s lease on this domain expires', null=True, blank=True)
     # Foreign Keys
     whois_status = models.ForeignKey('WhoisStatus', on_delete=models.PROTECT, null=True)
     health_status = models.ForeignKey('HealthStatus', on_delete=models.PROTECT, null=True)
@@ -198,3 +201,254 @@ class History(models.Model):
         if self.start_date and date.today() > self.end_date:
             return True
         return False
+
+
+class CachedResult(models.Model):
+    """Model representing a cached result from one of the reputation sources. Each source and
+    lookup key (a domain name or IP address) has one entry that is replaced when the source is
+    queried again. Entries are considered fresh until the source's TTL in settings passes.
+    """
+    source = models.CharField('Source', max_length=50, help_text='Name of the reputation source (e.g. talos)')
+    key = models.CharField('Lookup Key', max_length=255, help_text='Domain name or IP address that was looked up')
+    result = models.TextField('Result', help_text='JSON encoded result returned by the source')
+    fetched = models.DateTimeField('Fetched', help_text='Date and time the result was fetched from the source')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['source', 'key']
+        unique_together = (('source', 'key'),)
+        verbose_name = 'Cached result'
+        verbose_name_plural = 'Cached results'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.source}: {self.key} ({self.fetched})'
+
+
+class ReviewRun(models.Model):
+    """Model representing the checkpoint for a domain review run. Each domain's results are saved
+    as soon as the domain is reviewed, so a run that is interrupted can be resumed by reviewing
+    only the run's domains that have not been checked since the run started.
+    """
+    name = models.CharField('Name', max_length=255, unique=True, help_text='Name of the run (e.g. the Django Q task group)')
+    domain_ids = models.TextField('Domain IDs', help_text='JSON encoded list of the IDs of the domains selected for the run')
+    options = models.TextField('Options', default='{}', help_text='JSON encoded options for the run (e.g. the sources to check)')
+    started = models.DateTimeField('Started', help_text='Date and time the run started')
+    finished = models.DateTimeField('Finished', null=True, blank=True, help_text='Date and time the run finished')
+    checked = models.IntegerField('Domains Checked', default=0, help_text='Number of domains reviewed and saved so far')
+    last_domain = models.CharField('Last Domain', max_length=100, null=True, blank=True, help_text='The most recent domain saved by the run')
+    deferred = models.TextField('Deferred Domains', default='[]', help_text='JSON encoded list of the domains left for a later run when the time budget ran out')
+    shards = models.IntegerField('Shards', default=0, help_text='Number of shards queued for the run, if it was split across workers')
+    shards_finished = models.IntegerField('Shards Finished', default=0, help_text='Number of the run\'s shards that have finished')
+    shards_failed = models.IntegerField('Shards Failed', default=0, help_text='Number of the run\'s shards that failed')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['-started']
+        verbose_name = 'Review run'
+        verbose_name_plural = 'Review runs'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.name} ({self.checked} checked)'
+
+    @property
+    def is_finished(self):
+        """Property to test if the run has finished."""
+        return self.finished is not None
+
+
+class RateLimitState(models.Model):
+    """Model representing the shared state of one rate limit bucket. Every worker process reads
+    and updates the same row, so a rate limit applies to all of them together.
+    """
+    name = models.CharField('Name', max_length=100, unique=True, help_text='Name of the bucket (e.g. source:talos)')
+    tat = models.FloatField('Next Request Time', default=0, help_text='Unix time the next request is allowed at the sustained rate')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['name']
+        verbose_name = 'Rate limit state'
+        verbose_name_plural = 'Rate limit states'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return self.name
+
+
+class ProxyState(models.Model):
+    """Model representing the shared state of one outbound proxy for one source. Every worker
+    process reads and updates the same row, so a proxy benched or cooling down for a source is
+    skipped by all of them.
+    """
+    name = models.CharField('Name', max_length=255, unique=True, help_text='Name of the proxy and source (e.g. proxy:http://10.0.0.5:3128:bluecoat)')
+    cooling_until = models.FloatField('Cooling Until', default=0, help_text='Unix time the proxy may be used again after a 429 or 503')
+    benched_until = models.FloatField('Benched Until', default=0, help_text='Unix time the proxy may be used again after too many CAPTCHAs')
+    captchas = models.IntegerField('CAPTCHAs', default=0, help_text='CAPTCHAs in a row returned through the proxy')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['name']
+        verbose_name = 'Proxy state'
+        verbose_name_plural = 'Proxy states'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return self.name
+
+
+class ApiKeyState(models.Model):
+    """Model representing the shared budget of one VirusTotal API key. Every worker process counts
+    its requests against the same row, so the daily quota and any pause apply to all of them.
+    """
+    name = models.CharField('Name', max_length=100, unique=True, help_text='Name of the key (a hash, so the key itself is never stored)')
+    day = models.DateField('Day', null=True, blank=True, help_text='The day `used_today` was counted for')
+    used_today = models.IntegerField('Used Today', default=0, help_text='Number of requests made with the key on `day`')
+    paused_until = models.FloatField('Paused Until', default=0, help_text='Unix time the key may be used again after it was throttled or quarantined')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['name']
+        verbose_name = 'API key state'
+        verbose_name_plural = 'API key states'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return self.name
+
+
+class ResponseBlob(models.Model):
+    """Model representing the compressed body of a raw reputation source response. Bodies are
+    addressed by the SHA-256 digest of their uncompressed content, so identical responses (e.g.
+    the same "Uncategorized" page for many domains) are only stored once.
+    """
+    digest = models.CharField('Digest', max_length=64, unique=True, help_text='SHA-256 digest of the uncompressed response body')
+    content = models.BinaryField('Content', help_text='zlib compressed response body')
+    size = models.IntegerField('Size', help_text='Size of the uncompressed response body in bytes')
+
+    class Meta:
+        """Metadata for the model."""
+        verbose_name = 'Response blob'
+        verbose_name_plural = 'Response blobs'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.digest} ({self.size} bytes)'
+
+
+class ArchivedResponse(models.Model):
+    """Model representing a raw response archived for one reputation source and lookup key (a
+    domain name or IP address). The archive can be parsed again without any web requests.
+    """
+    source = models.CharField('Source', max_length=50, help_text='Name of the reputation source (e.g. talos)')
+    key = models.CharField('Lookup Key', max_length=255, help_text='Domain name or IP address that was looked up')
+    blob = models.ForeignKey(ResponseBlob, on_delete=models.CASCADE, related_name='responses', help_text='The response body')
+    fetched = models.DateTimeField('Fetched', help_text='Date and time the response was fetched from the source')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['source', 'key', '-fetched']
+        index_together = (('source', 'key', 'fetched'),)
+        verbose_name = 'Archived response'
+        verbose_name_plural = 'Archived responses'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.source}: {self.key} ({self.fetched})'
+
+
+class LookupRepair(models.Model):
+    """Model representing a failed source lookup for a domain that is waiting to be retried.
+    Each domain and source has one entry, which is removed once the source is checked
+    successfully. Failed retries wait longer each time before the next attempt.
+    """
+    domain = models.ForeignKey('Domain', on_delete=models.CASCADE, related_name='repairs', help_text='The domain whose lookup failed')
+    source = models.CharField('Source', max_length=50, help_text='Name of the reputation source (e.g. talos)')
+    attempts = models.IntegerField('Attempts', default=0, help_text='Number of retries that also failed')
+    failed = models.DateTimeField('Last Failed', help_text='Date and time the lookup last failed')
+    next_attempt = models.DateTimeField('Next Attempt', db_index=True, help_text='Date and time the lookup may be retried')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['next_attempt']
+        unique_together = (('domain', 'source'),)
+        verbose_name = 'Lookup repair'
+        verbose_name_plural = 'Lookup repairs'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.source}: {self.domain} ({self.attempts} attempts)'
+
+
+class Category(models.Model):
+    """Model representing a category name returned by one or more reputation sources. Each name
+    is stored once by its normalized form, so domains are linked to categories with indexed
+    lookups instead of searching the comma separated category fields. A category can be an alias
+    of another category, in which case the other category decides if it is blacklisted.
+    """
+    name = models.CharField('Name', max_length=100, help_text='The category as it was first returned by a source')
+    normalized = models.CharField('Normalized Name', max_length=100, unique=True, help_text='Lowercase name with single spaces used to match categories')
+    blacklisted = models.BooleanField('Blacklisted', default=False, db_index=True, help_text='Domains tagged with this category are flagged as burned')
+    alias_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='aliases', help_text='The category this one means the same thing as')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['normalized']
+        verbose_name = 'Category'
+        verbose_name_plural = 'Categories'
+
+    @staticmethod
+    def normalize(name):
+        """Return the provided category name in lowercase with single spaces."""
+        return ' '.join(name.split()).lower()
+
+    def save(self, *args, **kwargs):
+        """Keep the normalized name in step with the name."""
+        self.normalized = self.normalize(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return self.name
+
+
+class DomainCategory(models.Model):
+    """Model linking a domain to a category returned for it by one reputation source. The links
+    of a source are replaced every time the source's results for the domain are saved.
+    """
+    domain = models.ForeignKey('Domain', on_delete=models.CASCADE, related_name='category_links', help_text='The domain that was categorized')
+    category = models.ForeignKey('Category', on_delete=models.CASCADE, related_name='domain_links', help_text='The category returned by the source')
+    source = models.CharField('Source', max_length=50, help_text='Name of the reputation source (e.g. talos)')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['domain', 'source']
+        unique_together = (('domain', 'source', 'category'),)
+        verbose_name = 'Domain category'
+        verbose_name_plural = 'Domain categories'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.source}: {self.domain.name} ({self.category})'
+
+
+class ResultChange(models.Model):
+    """Model representing a change in one of a domain's check results. A row is only written when
+    a source's result (or the domain's health) differs from the last recorded value, so the
+    history grows with the number of changes rather than the number of runs.
+    """
+    domain = models.ForeignKey('Domain', on_delete=models.CASCADE, related_name='result_changes', help_text='The domain whose result changed')
+    source = models.CharField('Source', max_length=50, help_text='Name of the reputation source (e.g. talos) or `health_status` or `health_dns`')
+    value = models.TextField('Value', help_text='The new result')
+    changed = models.DateTimeField('Changed', db_index=True, help_text='Date and time the new result was saved')
+
+    class Meta:
+        """Metadata for the model."""
+        ordering = ['-changed']
+        index_together = (('domain', 'source', 'changed'),)
+        verbose_name = 'Result change'
+        verbose_name_plural = 'Result changes'
+
+    def __str__(self):
+        """String for representing the model object (in Admin site etc.)."""
+        return f'{self.source}: {self.domain.name} ({self.changed})'
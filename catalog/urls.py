@@ -41,6 +41,13 @@ urlpatterns += [
 urlpatterns += [
     path('checkout/<int:pk>', views.checkout, name='checkout'),
     path('release/<int:pk>', views.release, name='release'),
+    path('recheck/<int:pk>', views.recheck, name='recheck'),
+]
+
+# URLs for the API
+urlpatterns += [
+    path('api/domain/<int:pk>/recheck', views.recheck_api, name='recheck_api'),
+    path('api/changes', views.changes_api, name='changes_api'),
 ]
 
 # URLs for management functions
@@ -19,11 +19,13 @@ from django.contrib.auth.decorators import permission_required
 from django.contrib.auth.mixins import PermissionRequiredMixin
 
 # Django imports for forms
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 # Django Q imports for task management
-from django_q.tasks import async_task, result
+from django_q.tasks import async_task, result, fetch
 
 # Import for references to Django's settings.py
 from django.conf import settings
@@ -32,11 +34,19 @@ from django.conf import settings
 from django.db.models import Q
 from django.urls import reverse
 from catalog.forms import CheckoutForm, DomainCreateForm
-from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, Client, History, User
+from catalog.models import Domain, HealthStatus, DomainStatus, WhoisStatus, Client, History, User, DomainCategory
 
 # Import the Django-Q models
 from django_q.models import Success, Task
 
+# Import custom modules
+from tasks import queue_domain_checks, queue_domain_recheck
+from modules.ratelimit import RateScheduler, configured_rate_limits
+from modules.keypool import configured_virustotal_keys
+from modules.sources import SOURCES, get_sources
+from modules.categories import search_categories
+from modules.history import get_changes_since
+
 # Import Python libraries for various things
 import csv
 import codecs
@@ -274,23 +284,37 @@ def update(request):
     """View function to display the control panel for updating domain information."""
     # Check if the request is a POST and proceed with the task
     if request.method == 'POST':
-        # Add an async task grouped as `Domain Updates`
-        task_id = async_task('tasks.check_domains', group='Domain Updates', hook='tasks.send_slack_complete_msg')
+        # Cached source results are reused unless the user asked for a full refresh
+        force_refresh = request.POST.get('force_refresh') == 'on'
+        # Optionally limit the run to domains that are due for a check
+        try:
+            max_age = int(request.POST.get('max_age')) if request.POST.get('max_age') else None
+            limit = int(request.POST.get('limit')) if request.POST.get('limit') else None
+        except ValueError:
+            messages.error(request, 'The check age and domain limit must be whole numbers.')
+            return HttpResponseRedirect(reverse('update'))
+        # Only check the selected sources, or every enabled source if none were selected
+        sources = request.POST.getlist('sources') or None
+        # Split the run into shards so every worker can take part, grouped as `Domain Updates`
+        group, shard_count = queue_domain_checks(force_refresh=force_refresh, max_age=max_age, limit=limit, sources=sources)
         # Return to the update.html page with the confirmation message
-        messages.success(request, 'Task ID {} has been successfully queued!'.format(task_id))
+        messages.success(request, '{} tasks have been successfully queued in group "{}"!'.format(shard_count, group))
         return HttpResponseRedirect(reverse('update'))
     else:
         # Collect data for rendering the page
         total_domains = Domain.objects.all().count()
+        # VirusTotal is queried once per domain, so its rate limit sets the minimum run time
+        # The rate limit applies to each VirusTotal API key, so more keys mean a faster run
         try:
-            sleep_time = settings.DOMAINCHECK_CONFIG['sleep_time']
-            update_time = round(total_domains * sleep_time / 60, 2)
+            virustotal_rate = RateScheduler(configured_rate_limits()).requests_per_minute('virustotal')
+            virustotal_rate *= max(1, len(configured_virustotal_keys()))
+            update_time = round(total_domains / virustotal_rate, 2)
         except:
-            sleep_time = 20
-            update_time = round(total_domains * sleep_time / 60, 2)
+            virustotal_rate = 3
+            update_time = round(total_domains / virustotal_rate, 2)
         try:
             # Get the latest completed task from `Domain Updates`
-            queryset = Task.objects.filter(group='Domain Updates')[0]
+            queryset = Task.objects.filter(group__startswith='Domain Updates')[0]
             # Get the task's start date and time
             last_update_requested = queryset.started
             # Get the task's completed time
@@ -314,7 +338,9 @@ def update(request):
                     'last_update_completed': last_update_completed,
                     'last_update_time': last_update_time,
                     'last_result': last_result,
-                    'sleep_time': sleep_time
+                    'virustotal_rate': round(virustotal_rate, 2),
+                    'sources': get_sources(list(SOURCES)).values(),
+                    'enabled_sources': get_sources().keys()
                 }
         return render(request, 'catalog/update.html', context=context)
 
@@ -353,6 +379,79 @@ def update_dns(request):
                 }
         return render(request, 'catalog/update_dns.html', context=context)
 
+@login_required
+def recheck(request, pk):
+    """View function to queue an immediate review of one domain from its details page."""
+    domain_instance = get_object_or_404(Domain, pk=pk)
+    if request.method == 'POST':
+        # Rechecks only skip ahead of a bulk update when `recheck_cluster` names a priority
+        # cluster. By default they are queued with every other task.
+        task_id = queue_domain_recheck(domain_instance.id)
+        messages.success(request, 'Task ID {} has been queued to recheck {}! Refresh this page in a few seconds to see the results.'.format(
+                         task_id, domain_instance.name))
+    return HttpResponseRedirect(reverse('domain-detail', args=(domain_instance.id,)))
+
+@login_required
+def recheck_api(request, pk):
+    """API view to queue an immediate review of one domain with a POST or return the domain's
+    current health with a GET. Pass the `task_id` returned by the POST to a GET to see if the
+    recheck has finished.
+    """
+    domain_instance = get_object_or_404(Domain, pk=pk)
+    if request.method == 'POST':
+        task_id = queue_domain_recheck(domain_instance.id)
+        return JsonResponse({'domain': domain_instance.name, 'task_id': task_id}, status=202)
+    data = {
+            'domain': domain_instance.name,
+            'health_status': str(domain_instance.health_status),
+            'health_dns': domain_instance.health_dns,
+            'burned_explanation': domain_instance.burned_explanation,
+            'categories': domain_instance.all_cat,
+            'last_checked': domain_instance.last_checked.isoformat() if domain_instance.last_checked else None
+           }
+    task_id = request.GET.get('task_id')
+    if task_id:
+        # Django Q only saves a task once it has finished
+        task = fetch(task_id)
+        data['task'] = {
+                        'id': task_id,
+                        'finished': task is not None,
+                        'success': task.success if task else None,
+                        'result': str(task.result) if task else None
+                       }
+    return JsonResponse(data)
+
+@login_required
+def changes_api(request):
+    """API view to return the domain check results that changed after the `since` date and time
+    (ISO 8601, e.g. 2019-01-31T12:00:00Z). Use the `source` and `domain` parameters (each can be
+    repeated) to limit the changes and `limit` to cap how many are returned (default 1000).
+    """
+    try:
+        since = parse_datetime(request.GET.get('since', ''))
+    except ValueError:
+        since = None
+    if since is None:
+        return JsonResponse({'error': 'The `since` parameter must be an ISO 8601 date and time.'}, status=400)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    try:
+        limit = int(request.GET.get('limit', 1000))
+    except ValueError:
+        return JsonResponse({'error': 'The `limit` parameter must be a whole number.'}, status=400)
+    changes = get_changes_since(since, sources=request.GET.getlist('source'), domains=request.GET.getlist('domain'))
+    data = {
+            'since': since.isoformat(),
+            'changes': [{
+                         'domain': change.domain.name,
+                         'source': change.source,
+                         'previous': change.previous,
+                         'value': change.value,
+                         'changed': change.changed.isoformat()
+                        } for change in changes[:limit]]
+           }
+    return JsonResponse(data)
+
 @login_required
 def management(request):
     """View function to display the current settings configured for Shepherd."""
@@ -361,8 +460,8 @@ def management(request):
         config = settings.DOMAINCHECK_CONFIG
     # Pass the relevant settings to management.html
     context = {
-                'virustotal_api_key': config['virustotal_api_key'],
-                'sleep_time': config['sleep_time']
+                'virustotal_api_keys': configured_virustotal_keys(),
+                'rate_limits': sorted(configured_rate_limits().items())
               }
     return render(request, 'catalog/management.html', context=context)
 
@@ -386,7 +485,9 @@ class DomainListView(LoginRequiredMixin, generic.ListView):
         # TODO: We might consider using keywords like `category:technology` to search different fields
         if search_term:
             queryset = super(DomainListView, self).get_queryset()
-            return queryset.filter(Q(name__icontains=search_term) | Q(all_cat__icontains=search_term)).order_by('name')
+            # Categories are matched in the small Category table and then joined by index
+            category_links = DomainCategory.objects.filter(category__in=search_categories(search_term)).values('domain_id')
+            return queryset.filter(Q(name__icontains=search_term) | Q(id__in=category_links)).order_by('name')
         else:
             return Domain.objects.all().order_by('domain_status')
 
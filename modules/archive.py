@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the archive of raw reputation source responses. When the
+`archive_responses` setting is enabled, the body of each successful source response is stored
+compressed with zlib in the ResponseBlob model and addressed by its SHA-256 digest, so identical
+responses are only stored once. Each lookup gets an ArchivedResponse entry pointing at its body.
+
+The archive lets the `reparse_archive` management command rebuild every domain's categories and
+health with fixed parsers and without sending any web requests. Entries older than the
+`archive_retention` setting (days) are purged, except for the newest response of each lookup.
+"""
+
+import zlib
+import hashlib
+import datetime
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from catalog.models import ResponseBlob, ArchivedResponse
+from modules.cache import ResultCache
+
+
+class ResponseArchive(object):
+    """Class to store, read, and purge archived reputation source responses."""
+
+    def __init__(self):
+        """Everything that needs to be setup when a new ResponseArchive object is created goes here."""
+        # Try to get the archive options from settings
+        try:
+            self.enabled = bool(settings.DOMAINCHECK_CONFIG['archive_responses'])
+        except Exception as error:
+            self.enabled = False
+        try:
+            self.retention = float(settings.DOMAINCHECK_CONFIG['archive_retention'])
+        except Exception as error:
+            self.retention = 30
+
+    def store(self, source, key, content):
+        """Archive a raw response body for the source and key.
+
+        Parameters:
+
+        source          The name of the reputation source (e.g. talos)
+        key             The domain name or IP address that was looked up
+        content         The raw response body as bytes or text
+        """
+        if not self.enabled or content is None:
+            return
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        try:
+            # The archive shares SQLite's single writer with the result cache
+            with ResultCache.write_lock:
+                blob = ResponseBlob.objects.filter(digest=digest).first()
+                if blob is None:
+                    blob = ResponseBlob.objects.create(digest=digest, content=zlib.compress(content, 6), size=len(content))
+                ArchivedResponse.objects.create(source=source, key=key, blob=blob, fetched=timezone.now())
+        except Exception as error:
+            print('[!] Could not archive the {} response for {}: {}'.format(source, key, error))
+
+    def latest(self, source, key):
+        """Return the newest archived response body for the source and key as bytes or None."""
+        entry = ArchivedResponse.objects.filter(source=source, key=key).select_related('blob').order_by('-fetched').first()
+        if entry is None:
+            return None
+        return zlib.decompress(bytes(entry.blob.content))
+
+    def purge(self, retention=None):
+        """Delete archived responses older than the retention period and any response bodies
+        no longer used. The newest response of each lookup is always kept, so a lookup that has
+        not been repeated can still be parsed again. Returns the number of entries deleted.
+
+        Parameters:
+
+        retention       Defaults to the `archive_retention` setting. Days to keep responses.
+        """
+        if retention is None:
+            retention = self.retention
+        cutoff = timezone.now() - datetime.timedelta(days=float(retention))
+        newest = ArchivedResponse.objects.values('source', 'key').annotate(newest=Max('id')).values_list('newest', flat=True)
+        with ResultCache.write_lock:
+            deleted, _ = ArchivedResponse.objects.filter(fetched__lt=cutoff).exclude(id__in=list(newest)).delete()
+            ResponseBlob.objects.filter(responses__isnull=True).delete()
+        return deleted
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the local copy of the malwaredomains.com list of reported domains. The list
+is saved to disk and only downloaded again when the server reports it has changed (using the
+ETag and Last-Modified headers). The domains are held in a set, so checking a domain is a hash
+lookup of the domain and each of its parent domains rather than a search of the raw text.
+"""
+
+import os
+import json
+import tempfile
+
+from django.conf import settings
+
+
+def write_atomically(path, text):
+    """Write the text to a temporary file in the same directory and move it over the provided
+    path, so a worker reading the file never sees it half written.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                             prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w') as temp_file:
+            temp_file.write(text)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+class MalwareDomainList(object):
+    """Class to download, store, and search the malwaredomains.com list."""
+
+    def __init__(self, path=None):
+        """Everything that needs to be setup when a new MalwareDomainList object is created goes here.
+
+        Parameters:
+
+        path            Where to save the list. Defaults to the `malwaredomains_path` setting or
+                        malwaredomains.txt in the project directory.
+        """
+        if path is None:
+            try:
+                path = settings.DOMAINCHECK_CONFIG['malwaredomains_path']
+            except Exception as error:
+                path = os.path.join(settings.BASE_DIR, 'malwaredomains.txt')
+        self.path = path
+        # The response headers used for conditional requests are kept next to the list
+        self.metadata_path = path + '.json'
+        self.domains = set()
+
+    def __contains__(self, domain):
+        """Return True if the domain or one of its parent domains is on the list."""
+        labels = domain.lower().strip().rstrip('.').split('.')
+        # Stop before the bare TLD so a listed `com` entry can never match everything
+        for index in range(len(labels) - 1):
+            if '.'.join(labels[index:]) in self.domains:
+                return True
+        return False
+
+    def __len__(self):
+        """Return the number of domains on the list."""
+        return len(self.domains)
+
+    def parse(self, text):
+        """Parse the raw list into the set of domains. Blank lines and comments are skipped."""
+        domains = set()
+        for line in text.splitlines():
+            line = line.split('#', 1)[0].strip().lower().rstrip('.')
+            if line:
+                domains.add(line)
+        self.domains = domains
+
+    def load(self):
+        """Load the list saved on disk. Returns True if a saved list was found."""
+        try:
+            with open(self.path, 'r') as list_file:
+                self.parse(list_file.read())
+            return True
+        except (IOError, OSError):
+            return False
+
+    def read_metadata(self):
+        """Return the saved response headers for the list or an empty dictionary."""
+        try:
+            with open(self.metadata_path, 'r') as metadata_file:
+                return json.load(metadata_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def save(self, text, response_headers):
+        """Save the raw list and the headers needed for the next conditional request."""
+        write_atomically(self.path, text)
+        metadata = {
+                    'etag': response_headers.get('ETag'),
+                    'last_modified': response_headers.get('Last-Modified'),
+                   }
+        write_atomically(self.metadata_path, json.dumps(metadata))
+
+    def update(self, request, url, headers=None):
+        """Refresh the list from the provided URL. The saved copy is used if the server reports
+        the list has not changed or if the download fails. Returns True if a list is available.
+
+        Parameters:
+
+        request         A function accepting (method, url, **kwargs) that returns a response
+        url             The URL of the list
+        headers         Any additional request headers
+        """
+        headers = dict(headers or {})
+        saved = os.path.exists(self.path)
+        if saved:
+            metadata = self.read_metadata()
+            if metadata.get('etag'):
+                headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last_modified'):
+                headers['If-Modified-Since'] = metadata['last_modified']
+        try:
+            response = request('get', url, headers=headers, verify=False)
+            if response.status_code == 304 and saved:
+                print('[*] The malwaredomains.com list has not changed, so using the saved copy.')
+                return self.load()
+            if response.status_code == 200:
+                self.parse(response.text)
+                try:
+                    self.save(response.text, response.headers)
+                except (IOError, OSError) as error:
+                    print('[!] Could not save the malwaredomains.com list to {}: {}'.format(self.path, error))
+                return True
+            print('[!] Error reaching: {}, Status: {}'.format(url, response.status_code))
+        except Exception as error:
+            print('[!] Error reaching: {}, Error: {}'.format(url, error))
+        if saved:
+            print('[*] Falling back to the saved copy of the malwaredomains.com list.')
+            return self.load()
+        return False
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the circuit breaker used to stop querying a reputation source that keeps
+failing (e.g. returning CAPTCHAs, 403s, or 429s). After a number of consecutive failures the
+breaker opens and the source is skipped for the rest of the run.
+
+The breaker also holds the source's back-off state. When a source asks us to slow down, every
+request for that source waits until the back-off period has passed.
+"""
+
+import random
+import threading
+from time import sleep, monotonic
+
+
+# Result recorded for a source that could not be checked during a run
+NOT_CHECKED = 'Not checked'
+
+
+class SourceUnavailable(Exception):
+    """Raised when a request is made for a source whose circuit breaker is open."""
+    pass
+
+
+class CircuitBreaker(object):
+    """Class to track consecutive failures and back-off periods for a single source."""
+
+    def __init__(self, name, threshold=5, backoff_base=2, backoff_cap=120):
+        """Everything that needs to be setup when a new CircuitBreaker object is created goes here.
+
+        Parameters:
+
+        name            The name of the source (used for messages)
+        threshold       Number of consecutive failures that opens the breaker
+        backoff_base    Seconds to wait after the first rate limited response
+        backoff_cap     The longest back-off, in seconds
+        """
+        self.name = name
+        self.threshold = threshold
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failures = 0
+        self.is_open = False
+        self.resume_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return True if requests may still be sent to the source."""
+        return not self.is_open
+
+    def record_success(self):
+        """Reset the consecutive failure count after a successful lookup."""
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        """Count a failed lookup and open the breaker once the threshold is reached. Returns True
+        if this failure opened the breaker.
+        """
+        with self.lock:
+            self.failures += 1
+            if not self.is_open and self.failures >= self.threshold:
+                self.is_open = True
+                return True
+        return False
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Return the number of seconds to back off. The server's Retry-After value is used if it
+        was provided. Otherwise the delay grows exponentially with each attempt and is randomized
+        (full jitter) so concurrent requests do not retry in lock-step.
+
+        Parameters:
+
+        attempt         The number of retries already made for this request
+        retry_after     The value of the response's Retry-After header, if any
+        """
+        if retry_after:
+            try:
+                return min(self.backoff_cap, max(0, float(retry_after)))
+            except ValueError:
+                # Retry-After may also be an HTTP date, which is treated like a missing value
+                pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def back_off(self, delay):
+        """Pause every request for the source for the provided number of seconds."""
+        with self.lock:
+            self.resume_at = max(self.resume_at, monotonic() + delay)
+
+    def wait(self):
+        """Block until any back-off period for the source has passed."""
+        delay = self.resume_at - monotonic()
+        if delay > 0:
+            sleep(delay)
+        if self.is_open:
+            raise SourceUnavailable('The circuit breaker for {} is open'.format(self.name))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the persistent cache for reputation source results. Results are stored in
+the CachedResult model and keyed by the source's name and the lookup key (a domain name or IP
+address). Each source has its own time-to-live (TTL) configured in settings, so slow-changing
+data like categories can be reused for days while VirusTotal detections are refreshed often.
+"""
+
+import json
+import datetime
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from catalog.models import CachedResult
+
+
+class ResultCache(object):
+    """Class to read and write cached reputation source results."""
+    # Lookups run in many threads and SQLite only allows one writer, so writes are serialized
+    write_lock = threading.Lock()
+
+    def __init__(self):
+        """Everything that needs to be setup when a new ResultCache object is created goes here."""
+        # Try to get the TTLs (in hours) configured in settings
+        try:
+            self.ttls = dict(settings.DOMAINCHECK_CONFIG['cache_ttl'])
+        except Exception as error:
+            self.ttls = {}
+
+    def ttl(self, source):
+        """Return the TTL for the named source as a timedelta. Sources without a TTL are not cached."""
+        try:
+            return datetime.timedelta(hours=float(self.ttls.get(source, 0)))
+        except (TypeError, ValueError):
+            return datetime.timedelta(0)
+
+    def get(self, source, key):
+        """Return the cached result for the source and key or None if there is no fresh entry.
+
+        Parameters:
+
+        source          The name of the reputation source (e.g. talos)
+        key             The domain name or IP address that was looked up
+        """
+        ttl = self.ttl(source)
+        if not ttl:
+            return None
+        try:
+            entry = CachedResult.objects.get(source=source, key=key, fetched__gte=timezone.now() - ttl)
+            return json.loads(entry.result)
+        except CachedResult.DoesNotExist:
+            return None
+        except Exception as error:
+            print('[!] Could not read the cached {} result for {}: {}'.format(source, key, error))
+            return None
+
+    def set(self, source, key, result):
+        """Store a result for the source and key, replacing any older entry.
+
+        Parameters:
+
+        source          The name of the reputation source (e.g. talos)
+        key             The domain name or IP address that was looked up
+        result          A JSON serializable result
+        """
+        if not self.ttl(source):
+            return
+        try:
+            with self.write_lock:
+                CachedResult.objects.update_or_create(source=source, key=key,
+                                                      defaults={'result': json.dumps(result), 'fetched': timezone.now()})
+        except Exception as error:
+            print('[!] Could not cache the {} result for {}: {}'.format(source, key, error))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the OCR used to solve Bluecoat's CAPTCHA challenges. The CAPTCHA images
+are handled in memory and Tesseract runs in a small pool of worker processes, so the CPU-bound
+OCR work never blocks the threads waiting on web requests and concurrent reviews never write
+over each other's image files.
+
+Django Q runs tasks in daemonic worker processes, which are not allowed to start a process pool
+of their own. In those processes, Tesseract is run from the calling thread instead. Tesseract
+still runs as its own program, so the thread spends the OCR time waiting rather than holding
+the GIL.
+"""
+
+import io
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+import pytesseract
+from PIL import Image
+
+
+def ocr_captcha(image, timeout=0):
+    """Return the text read from the provided CAPTCHA image or False if OCR failed. This usually
+    runs in a worker process.
+
+    Parameters:
+
+    image           The raw bytes of the CAPTCHA image
+    timeout         Defaults to 0 (no timeout). Seconds Tesseract may run before it is stopped.
+    """
+    try:
+        # Perform basic OCR without additional image enhancement
+        text = pytesseract.image_to_string(Image.open(io.BytesIO(image)), timeout=timeout)
+    except Exception as error:
+        # Some pytesseract exceptions can't be sent back to the parent process, so report it here
+        print('[!] Error running OCR on the CAPTCHA: {}'.format(error))
+        return False
+    return text.replace(" ", "").replace("[", "l").replace("'", "").strip()
+
+
+class CaptchaSolver(object):
+    """Class to solve CAPTCHA images with Tesseract in a shared process pool."""
+    # The pool is shared by every DomainReview in this process and started on first use
+    executor = None
+    executor_lock = threading.Lock()
+
+    def __init__(self):
+        """Everything that needs to be setup when a new CaptchaSolver object is created goes here."""
+        # Try to get the number of OCR worker processes and the OCR timeout (in seconds)
+        try:
+            self.workers = max(1, int(settings.DOMAINCHECK_CONFIG['ocr_workers']))
+        except Exception as error:
+            self.workers = 1
+        try:
+            self.timeout = settings.DOMAINCHECK_CONFIG['ocr_timeout']
+        except Exception as error:
+            self.timeout = 30
+
+    def get_executor(self):
+        """Return the shared process pool, starting it if needed."""
+        with self.executor_lock:
+            if CaptchaSolver.executor is None:
+                CaptchaSolver.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return CaptchaSolver.executor
+
+    def solve(self, image):
+        """Return the CAPTCHA text for the provided image bytes or False if OCR failed.
+
+        Parameters:
+
+        image           The raw bytes of the CAPTCHA image
+        """
+        if multiprocessing.current_process().daemon:
+            # Daemonic processes (like Django Q's workers) can't start the process pool
+            return ocr_captcha(image, timeout=self.timeout)
+        try:
+            return self.get_executor().submit(ocr_captcha, image).result(timeout=self.timeout)
+        except BrokenProcessPool as error:
+            # A worker process died, so start a new pool for the next CAPTCHA
+            print('[!] The OCR process pool stopped unexpectedly: {}'.format(error))
+            with self.executor_lock:
+                CaptchaSolver.executor = None
+            return False
+        except Exception as error:
+            print('[!] Error running OCR on the CAPTCHA: {}'.format(error))
+            return False
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the helpers for the normalized category tables. Every category returned
+by a reputation source is stored once in the Category model by its normalized name (lowercase
+with single spaces), and each domain is linked to its categories for each source with the
+DomainCategory model. This lets category searches and burned checks use indexed queries instead
+of searching the comma separated category fields of every domain.
+
+The blacklist is kept in the database too. A category is blacklisted if it is flagged in the
+admin panel or if it is an alias of a flagged category, so a source's name for a bad category
+(e.g. `Malicious Sites`) can be tied to an existing one without a code change.
+"""
+
+from django.db import IntegrityError
+from django.db.models import Q
+from catalog.models import Category, DomainCategory, Domain
+from modules.breaker import NOT_CHECKED
+
+
+# Matches blacklisted categories and the aliases of blacklisted categories
+BLACKLISTED = Q(blacklisted=True) | Q(alias_of__blacklisted=True)
+
+
+def load_blacklist():
+    """Return the set of normalized names of every blacklisted category and alias."""
+    return frozenset(Category.objects.filter(BLACKLISTED).values_list('normalized', flat=True))
+
+
+def split_categories(value):
+    """Return the list of category names in a source's stored results. Results that were not
+    checked have no categories.
+    """
+    if not value or value == NOT_CHECKED:
+        return []
+    names = []
+    for name in value.split(', '):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def intern_categories(names):
+    """Return a dictionary of the Category for each of the provided names keyed by normalized
+    name. Categories that have not been seen before are added.
+    """
+    normalized = {Category.normalize(name): name for name in names}
+    categories = Category.objects.in_bulk(list(normalized), field_name='normalized')
+    for key, name in normalized.items():
+        if key not in categories:
+            try:
+                categories[key] = Category.objects.create(name=name)
+            except IntegrityError:
+                # Another worker added the category first
+                categories[key] = Category.objects.get(normalized=key)
+    return categories
+
+
+def save_domain_categories(domain, source, value):
+    """Replace the domain's category links for a source with the categories in its results.
+
+    Parameters:
+
+    domain          The Domain object that was reviewed
+    source          The name of the reputation source (e.g. talos)
+    value           The source's results as saved in the source's Domain field
+    """
+    if value == NOT_CHECKED:
+        # Keep the links from the last successful check
+        return
+    category_ids = {category.id for category in intern_categories(split_categories(value)).values()}
+    links = DomainCategory.objects.filter(domain_id=domain.id, source=source)
+    links.exclude(category_id__in=category_ids).delete()
+    category_ids.difference_update(links.values_list('category_id', flat=True))
+    DomainCategory.objects.bulk_create([DomainCategory(domain_id=domain.id, category_id=category_id, source=source)
+                                        for category_id in category_ids], ignore_conflicts=True)
+
+
+def search_categories(term):
+    """Return the categories with a name containing the search term, along with their aliases.
+    The Category table is small, so only the links to the matches are looked up by index.
+    """
+    term = Category.normalize(term)
+    return Category.objects.filter(Q(normalized__contains=term) | Q(alias_of__normalized__contains=term))
+
+
+def get_blacklisted_domains(queryset=None):
+    """Return the domains linked to a blacklisted category by any source.
+
+    Parameters:
+
+    queryset        Defaults to every domain. The Domain queryset to filter.
+    """
+    if queryset is None:
+        queryset = Domain.objects.all()
+    blacklisted_ids = Category.objects.filter(BLACKLISTED).values('id')
+    return queryset.filter(id__in=DomainCategory.objects.filter(category_id__in=blacklisted_ids).values('domain_id'))
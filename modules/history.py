@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the history of domain check results. Each run replaces the category and
+health fields of a domain, so every result that differs from the last recorded value for the
+same domain and source is also saved as a ResultChange. Results that were not checked are not
+recorded, so a source failing and recovering does not look like a change.
+
+The history answers "what changed since" a point in time with indexed queries, which is what the
+`api/changes` endpoint returns.
+"""
+
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from catalog.models import ResultChange
+from modules.breaker import NOT_CHECKED
+from modules.sources import SOURCES
+
+
+# Domain health fields recorded along with the results of each source
+HEALTH_FIELDS = ('health_status', 'health_dns')
+
+
+def get_domain_results(domain):
+    """Return a dictionary of a domain's stored results keyed by source name or health field."""
+    results = {}
+    for name, source in SOURCES.items():
+        if source.field:
+            results[name] = getattr(domain, source.field)
+    results['health_status'] = domain.health_status.health_status if domain.health_status else None
+    results['health_dns'] = domain.health_dns
+    return results
+
+
+def record_result_changes(domain, results, changed=None):
+    """Save a ResultChange for each result that differs from the last recorded value for the
+    domain and source. Returns the number of changes saved.
+
+    Parameters:
+
+    domain          The Domain object the results belong to
+    results         A dictionary of results keyed by source name or health field. Results that
+                    are None or not checked are skipped.
+    changed         Defaults to now. The date and time of the change.
+    """
+    results = {name: value for name, value in results.items() if value is not None and value != NOT_CHECKED}
+    if not results:
+        return 0
+    # The newest row for each source comes first
+    last_values = {}
+    for name, value in ResultChange.objects.filter(domain_id=domain.id, source__in=list(results)).order_by(
+                                                   '-changed', '-id').values_list('source', 'value'):
+        last_values.setdefault(name, value)
+    changed = changed or timezone.now()
+    changes = [ResultChange(domain_id=domain.id, source=name, value=value, changed=changed)
+               for name, value in results.items() if last_values.get(name) != value]
+    ResultChange.objects.bulk_create(changes)
+    return len(changes)
+
+
+def get_changes_since(since, sources=None, domains=None):
+    """Return the result changes saved after the provided time, oldest first. Each change is
+    annotated with the `previous` value for its domain and source, which is None for a domain's
+    first recorded result.
+
+    Parameters:
+
+    since           A timezone aware datetime
+    sources         Defaults to None. A list of source names or health fields to limit to.
+    domains         Defaults to None. A list of domain names to limit to.
+    """
+    previous = ResultChange.objects.filter(domain_id=OuterRef('domain_id'), source=OuterRef('source'),
+                                           changed__lt=OuterRef('changed')).order_by('-changed', '-id').values('value')[:1]
+    changes = ResultChange.objects.filter(changed__gt=since).select_related('domain')
+    if sources:
+        changes = changes.filter(source__in=sources)
+    if domains:
+        changes = changes.filter(domain__name__in=domains)
+    return changes.annotate(previous=Subquery(previous)).order_by('changed', 'id')
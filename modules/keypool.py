@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the pool of VirusTotal API keys. Every key has its own rate limit bucket
+and optional daily quota, so VirusTotal throughput grows with the number of keys. Each request
+uses the key with the most remaining budget.
+
+VirusTotal answers with a 204 or 429 when a key is throttled. The key is paused for the
+Retry-After period (or a minute) and the other keys carry on without it. A key that is refused
+with a 403 or that has used up its daily quota is quarantined for much longer.
+
+Keys are configured in settings with `virustotal_api_keys` (a list) and the older single
+`virustotal_api_key`. The `virustotal` entry in `rate_limits` is the rate for each key. With
+`shared_rate_limits` enabled, a key's rate, daily quota, and pauses are kept in the database, so
+they apply across every worker process using the key.
+"""
+
+import hashlib
+import datetime
+import threading
+from time import sleep, time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.db.models import F
+
+from catalog.models import ApiKeyState
+from modules.cache import ResultCache
+from modules.ratelimit import TokenBucket, SharedTokenBucket, parse_rate, shared_rate_limits
+
+
+# Seconds a throttled key is paused for when VirusTotal does not send a Retry-After header
+THROTTLE_PAUSE = 60
+
+
+class ApiKey(object):
+    """Class to track the budget of a single API key."""
+
+    def __init__(self, key, rate, daily_quota=None, shared=False):
+        """Everything that needs to be setup when a new ApiKey object is created goes here.
+
+        Parameters:
+
+        key             The API key
+        rate            The rate limit for the key (e.g. 4/min)
+        daily_quota     Defaults to None. The number of requests the key may make each day.
+        shared          Defaults to False. Set to True to share the key's rate limit bucket,
+                        daily quota, and pauses with every other process using the database.
+        """
+        self.key = key
+        # The key's shared state is named by a hash, so the key itself is never stored
+        self.name = 'virustotal:' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        self.shared = shared
+        # VirusTotal enforces its limit over any minute, so a key never bursts past its rate
+        if shared:
+            self.bucket = SharedTokenBucket(self.name, *parse_rate(rate), capacity=1)
+        else:
+            self.bucket = TokenBucket(*parse_rate(rate), capacity=1)
+        self.daily_quota = daily_quota
+        self.used_today = 0
+        self.day = datetime.date.today()
+        self.paused_until = 0
+
+    def __str__(self):
+        """String for representing the key without revealing it."""
+        return '...' + self.key[-6:]
+
+    def remaining_today(self):
+        """Return the requests left in today's quota or None if the key has no daily quota."""
+        if self.day != datetime.date.today():
+            self.day = datetime.date.today()
+            self.used_today = 0
+        if self.daily_quota is None:
+            return None
+        return max(0, self.daily_quota - self.used_today)
+
+    def is_usable(self):
+        """Return True if the key is not paused and has quota left today."""
+        return self.paused_until <= time() and self.remaining_today() != 0
+
+    def get_state(self):
+        """Return the key's ApiKeyState, adding it if needed."""
+        try:
+            return ApiKeyState.objects.get(name=self.name)
+        except ApiKeyState.DoesNotExist:
+            try:
+                with ResultCache.write_lock:
+                    ApiKeyState.objects.create(name=self.name, day=self.day)
+            except IntegrityError:
+                # Another process added the row first
+                pass
+            return ApiKeyState.objects.get(name=self.name)
+
+    def load_state(self, state):
+        """Copy the budget recorded in the key's ApiKeyState."""
+        self.paused_until = state.paused_until
+        if state.day == datetime.date.today():
+            self.day = state.day
+            self.used_today = state.used_today
+        else:
+            self.day = datetime.date.today()
+            self.used_today = 0
+
+    def take(self):
+        """Count a request against the key's daily quota. Returns False if the quota is used up.
+        Shared keys are counted with a conditional update, so two processes can never both take
+        the last request of the day.
+        """
+        if self.shared:
+            try:
+                today = datetime.date.today()
+                state = self.get_state()
+                with ResultCache.write_lock:
+                    if state.day == today:
+                        requests = ApiKeyState.objects.filter(name=self.name, day=today)
+                        if self.daily_quota is not None:
+                            requests = requests.filter(used_today__lt=self.daily_quota)
+                        taken = requests.update(used_today=F('used_today') + 1)
+                    else:
+                        # The first request of a new day starts the count over
+                        taken = ApiKeyState.objects.filter(name=self.name, day=state.day).update(day=today, used_today=1)
+                if not taken and state.day != today:
+                    # Another process started the new day first
+                    return self.take()
+                self.load_state(self.get_state())
+                return bool(taken)
+            except DatabaseError as error:
+                print('[!] Could not use the shared budget of VirusTotal API key {}, so only this process is counted: {}'.format(self, error))
+        if self.remaining_today() == 0:
+            return False
+        self.used_today += 1
+        return True
+
+    def pause(self, seconds):
+        """Stop using the key for the provided number of seconds."""
+        until = time() + seconds
+        self.paused_until = max(self.paused_until, until)
+        if self.shared:
+            try:
+                self.get_state()
+                with ResultCache.write_lock:
+                    ApiKeyState.objects.filter(name=self.name, paused_until__lt=until).update(paused_until=until)
+            except DatabaseError as error:
+                print('[!] Could not share the pause of VirusTotal API key {}: {}'.format(self, error))
+
+
+class ApiKeyPool(object):
+    """Class to hand out the API keys in a pool."""
+
+    def __init__(self, keys, rate='4/min', daily_quota=None, quarantine=60, shared=False):
+        """Everything that needs to be setup when a new ApiKeyPool object is created goes here.
+
+        Parameters:
+
+        keys            A list of API keys
+        rate            Defaults to 4/min. The rate limit for each key.
+        daily_quota     Defaults to None. The number of requests each key may make each day.
+        quarantine      Defaults to 60. Minutes to stop using a key after it is refused or its
+                        daily quota is used up.
+        shared          Defaults to False. Set to True to share each key's rate limit, daily
+                        quota, and pauses with every other process using the database.
+        """
+        self.keys = [ApiKey(key, rate, daily_quota, shared=shared) for key in keys]
+        self.quarantine_time = quarantine * 60
+        self.shared = shared
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of keys in the pool."""
+        return len(self.keys)
+
+    def requests_per_minute(self):
+        """Return the combined requests per minute allowed by every key."""
+        return sum(key.bucket.fill_rate * 60 for key in self.keys)
+
+    def load_state(self):
+        """Refresh every key's budget from the database if the keys are shared."""
+        if not self.shared:
+            return
+        try:
+            states = ApiKeyState.objects.in_bulk([key.name for key in self.keys], field_name='name')
+        except DatabaseError:
+            return
+        for key in self.keys:
+            if key.name in states:
+                key.load_state(states[key.name])
+
+    def acquire(self, max_wait=THROTTLE_PAUSE):
+        """Wait for and return the key with the most remaining budget. If every key is paused,
+        this waits for the first one to come back if that is within `max_wait` seconds. Returns
+        None if every key is quarantined or out of quota for today.
+        """
+        while True:
+            with self.lock:
+                self.load_state()
+                usable = sorted((key for key in self.keys if key.is_usable()),
+                                key=lambda key: (key.bucket.available(), key.remaining_today() or 0), reverse=True)
+                for key in usable:
+                    if key.take():
+                        delay = key.bucket.reserve()
+                        break
+                    # The key's daily quota was used up by another process
+                    self.quarantine(key)
+                else:
+                    key = None
+                waiting = [key.paused_until for key in self.keys if key.remaining_today() != 0]
+            if key is not None:
+                if delay > 0:
+                    sleep(delay)
+                return key
+            delay = min(waiting, default=0) - time()
+            if not waiting or delay > max_wait:
+                return None
+            sleep(max(0, delay))
+
+    def throttle(self, key, retry_after=None):
+        """Pause the key after VirusTotal throttled it. The Retry-After header is used if it was
+        provided. Otherwise the key is paused for a minute, which is VirusTotal's rate window.
+        """
+        try:
+            seconds = min(self.quarantine_time, max(0, float(retry_after)))
+        except (TypeError, ValueError):
+            seconds = THROTTLE_PAUSE
+        key.pause(seconds)
+        print('[*] VirusTotal API key {} was throttled, so it will not be used for {:.0f} seconds.'.format(key, seconds))
+
+    def quarantine(self, key):
+        """Stop using the key for the quarantine period after it was refused or its daily quota
+        was used up.
+        """
+        key.pause(self.quarantine_time)
+        print('[!] VirusTotal API key {} hit its quota, so it will not be used for {} minutes.'.format(key, self.quarantine_time // 60))
+
+
+def configured_virustotal_keys():
+    """Return the list of VirusTotal API keys configured in settings without duplicates."""
+    keys = []
+    try:
+        keys.extend(settings.DOMAINCHECK_CONFIG['virustotal_api_keys'])
+    except Exception:
+        pass
+    try:
+        keys.append(settings.DOMAINCHECK_CONFIG['virustotal_api_key'])
+    except Exception:
+        pass
+    return [key for index, key in enumerate(keys) if key and key not in keys[:index]]
+
+
+def configured_key_pool(rate):
+    """Return an ApiKeyPool of the VirusTotal API keys configured in settings.
+
+    Parameters:
+
+    rate            The rate limit for each key (e.g. 4/min)
+    """
+    try:
+        daily_quota = settings.DOMAINCHECK_CONFIG['virustotal_daily_quota']
+    except Exception:
+        daily_quota = None
+    try:
+        quarantine = settings.DOMAINCHECK_CONFIG['virustotal_quarantine']
+    except Exception:
+        quarantine = 60
+    return ApiKeyPool(configured_virustotal_keys(), rate, daily_quota=daily_quota, quarantine=quarantine,
+                      shared=shared_rate_limits())
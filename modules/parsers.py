@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the parsers for the pages and documents returned by the scraped reputation
+sources. Each parser pulls only the elements the review needs with precompiled lxml XPath
+expressions instead of building and searching a full BeautifulSoup tree, which adds up over
+thousands of pages in a large run.
+
+The JSON APIs have parsers too, so every source's raw response can be archived and parsed again
+later without any web requests (see modules/archive.py).
+
+Every parser has the same interface: `parse()` accepts the raw response content (bytes or text)
+and returns the source's results. The parsers are registered in PARSERS by name, so they can be
+benchmarked against saved pages with the `benchmark_parsers` management command.
+"""
+
+import re
+import json
+from collections import OrderedDict
+
+from lxml import etree
+from lxml import html
+
+
+class ResponseParser(object):
+    """Base class for a parser of one kind of source response."""
+    # Short name used to find the parser (e.g. opendns)
+    name = None
+    # Saved example response in modules/fixtures used by the parser benchmark
+    fixture = None
+
+    def parse(self, content):
+        """Return the results parsed from the provided response content."""
+        raise NotImplementedError
+
+    def document(self, content):
+        """Return the lxml HTML document for the provided response content."""
+        return html.fromstring(content)
+
+    def first_text(self, xpath, document):
+        """Return the stripped text of the first element matching the compiled XPath or None."""
+        nodes = xpath(document)
+        if nodes:
+            node = nodes[0]
+            text = node if isinstance(node, str) else node.text_content()
+            return text.strip()
+        return None
+
+
+class BluecoatParser(ResponseParser):
+    """Parser for the XML categorization result returned by Bluecoat."""
+    name = 'bluecoat'
+    fixture = 'bluecoat.xml'
+    names = etree.XPath('//CategorizationResult//categorization//categorization//name/text()')
+
+    def parse(self, content):
+        """Return the list of categories. A CAPTCHA challenge is returned as a `captcha` category.
+        The JSON result returned after a CAPTCHA is solved is also accepted.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if content.lstrip().startswith(b'{'):
+            return [category['name'] for category in json.loads(content.decode('utf-8'))['categorization']]
+        return [str(name) for name in self.names(etree.fromstring(content))]
+
+
+class FortiguardParser(ResponseParser):
+    """Parser for the Fortiguard web filter lookup page."""
+    name = 'fortiguard'
+    fixture = 'fortiguard.html'
+    # The category is in a meta description tag and repeated in the page's info title
+    meta = etree.XPath('//meta[starts-with(@content, "Category: ")]/@content')
+    title = etree.XPath('//h4[@class="info_title"][starts-with(normalize-space(.), "Category: ")]')
+
+    def parse(self, content):
+        """Return the list of categories."""
+        document = self.document(content)
+        text = self.first_text(self.meta, document) or self.first_text(self.title, document)
+        if text is None:
+            raise ValueError('No category was found in the Fortiguard response')
+        return [text.split('Category: ', 1)[1].strip()]
+
+
+class MXToolboxFormParser(ResponseParser):
+    """Parser for the ASP.NET state tokens on the MXToolbox Brand Reputation form."""
+    name = 'mxtoolbox_form'
+    fixture = 'mxtoolbox_form.html'
+    fields = ('__VIEWSTATE', '__VIEWSTATEGENERATOR', '__EVENTVALIDATION')
+    inputs = etree.XPath('//input[@name="__VIEWSTATE" or @name="__VIEWSTATEGENERATOR" or @name="__EVENTVALIDATION"]')
+
+    def parse(self, content):
+        """Return a dictionary of the form's state token values keyed by field name."""
+        tokens = {node.get('name'): node.get('value') for node in self.inputs(self.document(content))}
+        missing = [field for field in self.fields if field not in tokens]
+        if missing:
+            raise ValueError('The MXToolbox form is missing {}'.format(', '.join(missing)))
+        return tokens
+
+
+class MXToolboxResultParser(ResponseParser):
+    """Parser for the MXToolbox Brand Reputation results page."""
+    name = 'mxtoolbox'
+    fixture = 'mxtoolbox.html'
+    no_issues = etree.XPath('//div[@id="ctl00_ContentPlaceHolder1_noIssuesFound"]')
+    safe_browsing = etree.XPath('//div[@id="ctl00_ContentPlaceHolder1_googleSafeBrowsingIssuesFound"]')
+    phishtank = etree.XPath('//div[@id="ctl00_ContentPlaceHolder1_phishTankIssuesFound"]')
+
+    def parse(self, content):
+        """Return the list of issues found. A ValueError is raised if the page has no results,
+        which is what MXToolbox returns when the form's state tokens are rejected.
+        """
+        document = self.document(content)
+        issues = []
+        if self.no_issues(document):
+            issues.append('No issues found')
+        else:
+            if self.safe_browsing(document):
+                issues.append('Google SafeBrowsing Issues Found.')
+            if self.phishtank(document):
+                issues.append('PhishTank Issues Found')
+        if not issues:
+            raise ValueError('No results were found in the MXToolbox response')
+        return issues
+
+
+class OpenDNSParser(ResponseParser):
+    """Parser for the OpenDNS domain tagging page."""
+    name = 'opendns'
+    fixture = 'opendns.html'
+    tags = etree.XPath('//span[contains(concat(" ", normalize-space(@class), " "), " normal ")]')
+
+    def parse(self, content):
+        """Return the list of tags or `No Tags` if the domain has none."""
+        text = self.first_text(self.tags, self.document(content))
+        if text:
+            return text.split(', ')
+        return ['No Tags']
+
+
+class TrendMicroParser(ResponseParser):
+    """Parser for the Trend Micro Site Safety results page."""
+    name = 'trendmicro'
+    fixture = 'trendmicro.html'
+    label = etree.XPath('//div[contains(concat(" ", normalize-space(@class), " "), " labeltitlesmallresult ")]')
+
+    def parse(self, content):
+        """Return the list of categories or `Uncategorized` if the domain has none."""
+        text = self.first_text(self.label, self.document(content))
+        if text:
+            return text.split(', ')
+        return ['Uncategorized']
+
+
+class TalosParser(ResponseParser):
+    """Parser for the Cisco Talos domain details JSON."""
+    name = 'talos'
+    fixture = 'talos.json'
+
+    def parse(self, content):
+        """Return the list of categories or `Uncategorized` if the domain has none."""
+        category = json.loads(content)['category']
+        if category:
+            return [category['description']]
+        return ['Uncategorized']
+
+
+class XForceParser(ResponseParser):
+    """Parser for the IBM X-Force URL report JSON."""
+    name = 'xforce'
+    fixture = 'xforce.json'
+
+    def parse(self, content):
+        """Return the list of categories, `Uncategorized` if the domain has none, or `Unknown` if
+        X-Force has never seen the domain.
+        """
+        report = json.loads(content)
+        # IBM X-Force returns {"error":"Not found."} if the domain is unknown
+        if 'result' not in report:
+            return ['Unknown']
+        if not report['result']['cats']:
+            return ['Uncategorized']
+        # The category names are the keys of the `cats` dictionary
+        return list(report['result']['cats'])
+
+
+class VirusTotalParser(ResponseParser):
+    """Parser for the VirusTotal domain report JSON.
+
+    Reports for popular or abused domains can be several megabytes of URL and sample lists, but
+    the review only needs the categories, the passive DNS resolutions, and the number of detected
+    URLs and samples. The report is walked one list item and object member at a time, so only
+    those values are kept and memory use is bounded by the largest single item rather than the
+    whole report.
+    """
+    name = 'virustotal'
+    fixture = 'virustotal.json'
+    # Top level values that are kept and the lists that are only counted
+    decoded = ('categories', 'resolutions')
+    counted = ('detected_urls', 'detected_downloaded_samples')
+    whitespace = re.compile(r'\s*')
+    decoder = json.JSONDecoder()
+
+    def parse(self, content, resolutions=None):
+        """Return a dictionary with the report's `categories`, the `resolutions` sorted with the
+        most recent first, and the number of `detected_urls` and `detected_downloaded_samples`.
+
+        Parameters:
+
+        content         The raw response content
+        resolutions     Defaults to None. The maximum number of resolutions to return.
+        """
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        report = {}
+
+        def member(key, position):
+            if key in self.decoded:
+                report[key], position = self.decoder.raw_decode(content, position)
+                return position
+            if key in self.counted:
+                report[key], position = self.walk_list(content, position)
+                return position
+            return self.skip_value(content, position)
+
+        position = self.skip_whitespace(content, 0)
+        if content[position:position + 1] != '{':
+            raise ValueError('The VirusTotal report is not a JSON object')
+        self.walk_object(content, position, member)
+        if 'resolutions' in report:
+            report['resolutions'].sort(key=lambda address: address.get('last_resolved') or '', reverse=True)
+            if resolutions is not None:
+                del report['resolutions'][resolutions:]
+        return report
+
+    def skip_whitespace(self, content, position):
+        """Return the position of the next character that is not whitespace."""
+        return self.whitespace.match(content, position).end()
+
+    def expect(self, content, position, characters):
+        """Return the position after any whitespace if the next character is one of the provided
+        characters. A ValueError is raised otherwise.
+        """
+        position = self.skip_whitespace(content, position)
+        if content[position:position + 1] not in tuple(characters):
+            raise ValueError('Expected one of "{}" at position {} of the VirusTotal report'.format(characters, position))
+        return position
+
+    def walk_list(self, content, position):
+        """Decode the items of the list starting at the provided position one at a time without
+        keeping them. Each item is decoded by the C JSON decoder, so this is about as fast as
+        loading the list. Returns the number of items and the list's end position.
+        """
+        if content[position] != '[':
+            return 0, self.skip_value(content, position)
+        items = 0
+        position = self.skip_whitespace(content, position + 1)
+        if content[position:position + 1] == ']':
+            return items, position + 1
+        while True:
+            position = self.decoder.raw_decode(content, position)[1]
+            items += 1
+            position = self.expect(content, position, ',]')
+            if content[position] == ']':
+                return items, position + 1
+            position = self.skip_whitespace(content, position + 1)
+
+    def walk_object(self, content, position, member):
+        """Walk the members of the object starting at the provided position. The `member`
+        function is called with each key and the position of its value and returns the value's
+        end position. Returns the object's end position.
+        """
+        position = self.skip_whitespace(content, position + 1)
+        if content[position:position + 1] == '}':
+            return position + 1
+        while True:
+            key, position = self.decoder.raw_decode(content, self.expect(content, position, '"'))
+            position = self.skip_whitespace(content, self.expect(content, position, ':') + 1)
+            position = member(key, position)
+            position = self.expect(content, position, ',}')
+            if content[position] == '}':
+                return position + 1
+            position = self.skip_whitespace(content, position + 1)
+
+    def skip_value(self, content, position):
+        """Return the end position of the value starting at the provided position."""
+        if content[position] == '[':
+            return self.walk_list(content, position)[1]
+        if content[position] == '{':
+            return self.walk_object(content, position, lambda key, position: self.decoder.raw_decode(content, position)[1])
+        return self.decoder.raw_decode(content, position)[1]
+
+
+class CymonParser(ResponseParser):
+    """Parser for the Cymon IP address page."""
+    name = 'cymon'
+    fixture = 'cymon.html'
+
+    def parse(self, content):
+        """Return True if the IP address is flagged or False if it is not."""
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'replace')
+        return 'IP Not Found' not in content
+
+
+# The registry of parsers, keyed by name
+PARSERS = OrderedDict()
+for parser in (BluecoatParser(), FortiguardParser(), MXToolboxFormParser(), MXToolboxResultParser(),
+               OpenDNSParser(), TrendMicroParser(), TalosParser(), XForceParser(), VirusTotalParser(),
+               CymonParser()):
+    PARSERS[parser.name] = parser
+
+
+def parse(name, content, **options):
+    """Parse the provided response content with the named parser.
+
+    Parameters:
+
+    name            The name of a parser in PARSERS (e.g. opendns)
+    content         The raw response content
+    options         Any options the parser accepts (e.g. `resolutions` for virustotal)
+    """
+    return PARSERS[name].parse(content, **options)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the rate limiting tools used to pace requests sent to each of the
+reputation sources. Every source gets its own token bucket, so a slow source with a strict quota
+(e.g. VirusTotal) does not hold back the others.
+
+Rates are written as strings like `4/min`, `30/minute`, `1/20s`, or `100/hour`.
+
+When the `shared_rate_limits` setting is enabled, the buckets are kept in the database, so every
+Django Q worker process draws from the same budget and the configured rates apply to the whole
+cluster rather than to each worker.
+"""
+
+import re
+import threading
+from time import sleep, monotonic, time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from catalog.models import RateLimitState
+from modules.cache import ResultCache
+
+
+# Number of seconds in each supported rate unit
+RATE_UNITS = {
+              's': 1, 'sec': 1, 'second': 1,
+              'm': 60, 'min': 60, 'minute': 60,
+              'h': 3600, 'hour': 3600,
+              'd': 86400, 'day': 86400,
+             }
+
+
+def parse_rate(rate):
+    """Parse a rate string and return a tuple of (requests, seconds).
+
+    Parameters:
+
+    rate            A rate string like `4/min` or `1/20s`
+    """
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)?\s*([a-z]+)\s*$', str(rate).lower())
+    if not match or match.group(3) not in RATE_UNITS:
+        raise ValueError('Invalid rate "{}". Use a value like "4/min" or "1/20s".'.format(rate))
+    count = float(match.group(1))
+    multiplier = float(match.group(2)) if match.group(2) else 1
+    if count <= 0:
+        raise ValueError('Invalid rate "{}". The request count must be above zero.'.format(rate))
+    return count, multiplier * RATE_UNITS[match.group(3)]
+
+
+def configured_rate_limits():
+    """Return the dictionary of rate limits configured in settings. If VirusTotal has no rate
+    limit, the older `sleep_time` setting is converted into one.
+    """
+    try:
+        rate_limits = dict(settings.DOMAINCHECK_CONFIG['rate_limits'])
+    except Exception:
+        rate_limits = {}
+    if 'virustotal' not in rate_limits:
+        try:
+            request_delay = settings.DOMAINCHECK_CONFIG['sleep_time']
+        except Exception:
+            request_delay = 20
+        rate_limits['virustotal'] = '1/{}s'.format(request_delay)
+    return rate_limits
+
+
+def shared_rate_limits():
+    """Return True if the rate limit buckets should be shared by every worker process."""
+    try:
+        return bool(settings.DOMAINCHECK_CONFIG['shared_rate_limits'])
+    except Exception:
+        return True
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket. The bucket holds up to `capacity` tokens and refills at a steady
+    rate. Each request takes one token and callers wait when the bucket is empty.
+    """
+
+    def __init__(self, count, period, capacity=None):
+        """Everything that needs to be setup when a new TokenBucket object is created goes here.
+
+        Parameters:
+
+        count           The number of requests allowed per period
+        period          The length of the period in seconds
+        capacity        Defaults to `count`. The largest burst of requests allowed at once. The
+                        bucket starts full, so up to `capacity + count` requests may be sent in the
+                        first period. Use 1 for a limit that must never be exceeded in any period.
+        """
+        self.capacity = capacity or count
+        self.fill_rate = count / period
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def available(self):
+        """Return the number of tokens in the bucket right now without taking one."""
+        with self.lock:
+            return min(self.capacity, self.tokens + (monotonic() - self.updated) * self.fill_rate)
+
+    def reserve(self):
+        """Take a token from the bucket and return how many seconds the caller must wait before
+        using it. The bucket may go negative, which queues callers in the order they arrived.
+        """
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.fill_rate
+
+    def wait(self):
+        """Block until a token is available and return the number of seconds spent waiting."""
+        delay = self.reserve()
+        if delay > 0:
+            sleep(delay)
+        return delay
+
+
+class SharedTokenBucket(TokenBucket):
+    """A token bucket kept in the RateLimitState model, so every process using the database draws
+    from the same budget. The state is the time the next request is allowed at the sustained rate
+    (the generic cell rate algorithm), which behaves like a token bucket with the same capacity.
+    It is changed with a compare-and-swap update, so two processes can never take the same token.
+    If the database can't be used, the bucket falls back to limiting this process only.
+    """
+
+    def __init__(self, name, count, period, capacity=None):
+        """Everything that needs to be setup when a new SharedTokenBucket object is created goes here.
+
+        Parameters:
+
+        name            A unique name for the bucket (e.g. source:talos)
+        count           The number of requests allowed per period
+        period          The length of the period in seconds
+        capacity        Defaults to `count`. The largest burst of requests allowed at once.
+        """
+        super().__init__(count, period, capacity)
+        self.name = name
+        self.interval = period / count
+
+    def get_state(self):
+        """Return the time the next request is allowed, adding the bucket's row if needed."""
+        try:
+            return RateLimitState.objects.get(name=self.name).tat
+        except RateLimitState.DoesNotExist:
+            try:
+                with ResultCache.write_lock:
+                    RateLimitState.objects.create(name=self.name, tat=0)
+            except IntegrityError:
+                # Another process added the row first
+                pass
+            return RateLimitState.objects.get(name=self.name).tat
+
+    def available(self):
+        """Return the number of tokens in the bucket right now without taking one."""
+        try:
+            now = time()
+            return self.capacity - (max(self.get_state(), now) - now) / self.interval
+        except DatabaseError:
+            return super().available()
+
+    def reserve(self):
+        """Take a token from the bucket and return how many seconds the caller must wait before
+        using it. Callers that have to wait are queued in the order they arrived.
+        """
+        try:
+            while True:
+                now = time()
+                tat = self.get_state()
+                start = max(tat, now)
+                with ResultCache.write_lock:
+                    if RateLimitState.objects.filter(name=self.name, tat=tat).update(tat=start + self.interval):
+                        return max(0, start - now - (self.capacity - 1) * self.interval)
+        except DatabaseError as error:
+            print('[!] Could not use the shared {} rate limit, so only this process is limited: {}'.format(self.name, error))
+            return super().reserve()
+
+
+class RateScheduler(object):
+    """Class to hold a token bucket for each reputation source. Sources without a configured rate
+    are not limited.
+    """
+
+    def __init__(self, rate_limits=None, shared=False):
+        """Everything that needs to be setup when a new RateScheduler object is created goes here.
+
+        Parameters:
+
+        rate_limits     A dictionary of source names and rate strings, e.g. {'virustotal': '4/min'}
+        shared          Defaults to False. Set to True to share each source's bucket with every
+                        other process using the database.
+        """
+        self.buckets = {}
+        self.rates = {}
+        self.shared = shared
+        if rate_limits:
+            for source, rate in rate_limits.items():
+                self.set_rate(source, rate)
+
+    def set_rate(self, source, rate):
+        """Set or replace the rate limit for the named source."""
+        count, period = parse_rate(rate)
+        self.rates[source] = rate
+        if self.shared:
+            self.buckets[source] = SharedTokenBucket('source:' + source, count, period)
+        else:
+            self.buckets[source] = TokenBucket(count, period)
+
+    def requests_per_minute(self, source):
+        """Return the sustained number of requests per minute allowed for the named source or
+        None if the source is not limited.
+        """
+        if source in self.buckets:
+            return self.buckets[source].fill_rate * 60
+        return None
+
+    def wait(self, source):
+        """Block until the named source's bucket allows another request."""
+        if source in self.buckets:
+            return self.buckets[source].wait()
+        return 0
@@ -16,20 +16,30 @@ import re
 import csv
 import sys
 import json
-import shutil
 import base64
-from time import sleep
+import threading
+from time import monotonic
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from django.conf import settings
-from catalog.models import Domain
+from catalog.models import Domain, Category
+from modules.cache import ResultCache
+from modules.blocklist import MalwareDomainList
+from modules.ratelimit import RateScheduler, configured_rate_limits, shared_rate_limits
+from modules.sources import SOURCES, DEFAULT_TIMEOUT, get_sources
+from modules.breaker import CircuitBreaker, NOT_CHECKED
+from modules.captcha import CaptchaSolver
+from modules.parsers import parse
+from modules.transport import get_transport
+from modules.keypool import configured_key_pool
+from modules.archive import ResponseArchive
+from modules.proxies import configured_proxy_pool
+from modules.categories import load_blacklist
 
 import requests
-import pytesseract
-from PIL import Image
-from lxml import etree
 from lxml import objectify
 from cymon import Cymon
-from bs4 import BeautifulSoup
 
 
 # Disable requests warnings for things like disabling certificate checking
@@ -43,31 +53,101 @@ class DomainReview(object):
     # API endpoints
     malwaredomains_url = 'http://mirror1.malwaredomains.com/files/justdomains'
     virustotal_domain_report_uri = 'https://www.virustotal.com/vtapi/v2/domain/report?apikey={}&domain={}'
-    # Categories we don't want to see
-    # These are lowercase to avoid inconsistencies with how each service might return the categories
-    blacklisted = ['phishing', 'web ads/analytics', 'suspicious', 'shopping', 'placeholders', 
-                   'pornography', 'spam', 'gambling', 'scam/questionable/illegal', 
-                   'malicious sources/malnets']
     # Variables for web browsing
     useragent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/70.0.3538.77 Safari/537.36'
-    session = requests.Session()
+    # Bluecoat CAPTCHAs are solved for the shared session, so one solution covers every domain
+    captcha_lock = threading.Lock()
+    captchas_solved = 0
+    # MXToolbox form tokens are also tied to the shared session and reused for every domain
+    mxtoolbox_lock = threading.Lock()
+    mxtoolbox_tokens = None
+    mxtoolbox_tokens_fetched = 0
+    # TrendMicro only needs its landing page visited once to set up the shared session's cookies
+    trendmicro_lock = threading.Lock()
+    trendmicro_warm = False
+    trendmicro_warmups = 0
+    # The seconds each domain's review took in the last run, used to plan the next time-budgeted run
+    domain_cost_estimate = None
 
-    def __init__(self, domain_queryset):
-        """Everything that needs to be setup when a new DomainReview object is created goes here."""
+    def __init__(self, domain_queryset, force_refresh=False, sources=None, time_budget=None):
+        """Everything that needs to be setup when a new DomainReview object is created goes here.
+
+        Parameters:
+
+        domain_queryset     The Domain objects to be reviewed
+        force_refresh       Defaults to False. Set to True to ignore cached results and query
+                            every source again.
+        sources             Defaults to None. A list of source names to limit the review to
+                            (e.g. ['virustotal', 'talos']). Every enabled source is checked
+                            when not provided.
+        time_budget         Defaults to None. Seconds the review may run. No new domain is
+                            started once its estimated review time would pass the deadline, and
+                            the domains left are listed in `deferred`.
+        """
         # Domain query results from the Django models
         self.domain_queryset = domain_queryset
-        # Try to get the sleep time configured in settings
+        # The reputation sources checked in this run, with their timeouts and concurrency limits
+        self.sources = get_sources(sources)
+        # Results cached from earlier runs are reused unless a refresh is forced
+        self.cache = ResultCache()
+        self.force_refresh = force_refresh
+        # Categories we don't want to see, normalized to avoid inconsistencies with how each
+        # service might return the categories (see the Category model in the admin panel)
+        self.blacklisted = load_blacklist()
+        # Raw responses are archived when enabled in settings, so they can be parsed again later
+        self.archive = ResponseArchive()
+        # IP address lookups shared by every domain in this run
+        self.ip_lookups = {}
+        self.ip_lookups_lock = threading.Lock()
+        # Failed (source, domain) lookups and a circuit breaker for each source
+        self.failures = set()
+        self.failures_lock = threading.Lock()
+        try:
+            breaker_threshold = settings.DOMAINCHECK_CONFIG['breaker_threshold']
+        except Exception as error:
+            breaker_threshold = 5
+        try:
+            self.max_retries = settings.DOMAINCHECK_CONFIG['max_retries']
+        except Exception as error:
+            self.max_retries = 3
+        self.breakers = {name: CircuitBreaker(name, threshold=breaker_threshold) for name in self.sources}
+        # Try to get the number of passive DNS resolutions kept from each VirusTotal report
+        try:
+            self.max_resolutions = settings.DOMAINCHECK_CONFIG['virustotal_resolutions']
+        except Exception as error:
+            self.max_resolutions = 25
+        # Domains are only started while they are expected to finish within the time budget
+        self.time_budget = time_budget
+        self.deadline = None
+        self.deferred = []
+        self.domain_cost = self.domain_cost_estimate
+        self.domain_cost_lock = threading.Lock()
+        # Try to get the number of domains loaded from the database at a time
         try:
-            self.request_delay = settings.DOMAINCHECK_CONFIG['sleep_time']
+            self.chunk_size = settings.DOMAINCHECK_CONFIG['chunk_size']
         except Exception as error:
-            self.request_delay = 20
-        
+            self.chunk_size = 100
+        # Every web request goes through this process's pooled transport and shares its session
+        self.transport = get_transport()
+        self.session = self.transport.session
+        # Bluecoat CAPTCHAs are read with OCR in a separate process pool
+        self.captcha_solver = CaptchaSolver()
+        if 'bluecoat' in self.sources:
+            self.load_bluecoat_session()
+        # Each source waits on its own rate limit configured in settings
+        rate_limits = configured_rate_limits()
+        # VirusTotal is paced by its pool of API keys instead, using its rate limit for each key
+        self.virustotal_keys = configured_key_pool(rate_limits.pop('virustotal'))
+        self.scheduler = RateScheduler(rate_limits, shared=shared_rate_limits())
+        # The scraped sources can spread their requests across outbound proxies, each with its own rate limits
+        self.proxy_pool = configured_proxy_pool(rate_limits)
+        # Try to get the number of domains to review at the same time
         try:
-            self.virustotal_api_key = settings.DOMAINCHECK_CONFIG['virustotal_api_key']
+            self.max_workers = max(1, int(settings.DOMAINCHECK_CONFIG['max_workers']))
         except Exception as error:
-            self.virustotal_api_key = None
+            self.max_workers = 4
+        if not self.virustotal_keys and 'virustotal' in self.sources:
             print('[!] A VirusTotal API key could not be pulled from settings.py. Review settings to perform VirusTotal checks.')
-            exit()
 
     def check_virustotal(self, domain, ignore_case=False):
         """Check the provided domain name with VirusTotal. VirusTotal's API is case sensitive, so
@@ -77,18 +157,125 @@ class DomainReview(object):
         This uses the VirusTotal /domain/report endpoint:
 
         https://developers.virustotal.com/v2.0/reference#domain-report
+
+        Each request uses the API key with the most remaining budget. If a key is throttled, it
+        is paused for a short while, and if it is refused, it is quarantined. Either way the
+        request is tried again with the next best key.
+
+        Only the categories, the most recent `virustotal_resolutions` passive DNS resolutions,
+        and the number of detected URLs and samples are pulled out of the report.
         """
-        if self.virustotal_api_key:
+        if self.virustotal_keys:
+            lookup_key = domain
             if not ignore_case:
                 domain = domain.lower()
             try:
-                req = self.session.get(self.virustotal_domain_report_uri.format(self.virustotal_api_key, domain))
-                vt_data = req.json()
-            except:
-                vt_data = None
-            return vt_data
+                for attempt in range(len(self.virustotal_keys) + self.max_retries):
+                    api_key = self.virustotal_keys.acquire()
+                    if api_key is None:
+                        print('[!] Every VirusTotal API key is quarantined or out of quota.')
+                        break
+                    # A 429 means this key is over its rate, so the next key is tried without backing off
+                    req = self._request('virustotal', 'get', self.virustotal_domain_report_uri.format(api_key.key, domain),
+                                        quota_statuses=(429,))
+                    # VirusTotal returns a 204 with no content when the key is throttled
+                    if req.status_code in (204, 429):
+                        self.virustotal_keys.throttle(api_key, req.headers.get('Retry-After'))
+                        continue
+                    # A 403 means the key was refused, which won't clear up within the run
+                    if req.status_code == 403:
+                        self.virustotal_keys.quarantine(api_key)
+                        continue
+                    if req.status_code != 200:
+                        print('[!] VirusTotal request failed. Request returned status "{}"'.format(req.status_code))
+                        break
+                    report = parse('virustotal', req.content, resolutions=self.max_resolutions)
+                    self.archive_response('virustotal', lookup_key, req)
+                    return report
+            except Exception as error:
+                print('[!] VirusTotal request failed: {}'.format(error))
+            self.mark_failed('virustotal', lookup_key)
+        return None
+
+    def _request(self, source, method, url, captcha=None, quota_statuses=(), **kwargs):
+        """Send a web request on behalf of the named source. The request waits only on that
+        source's rate limit bucket.
+
+        Requests use the source's timeout unless one is provided. If the source responds with a
+        429 or 503, every request for the source backs off (using the Retry-After header when it
+        is provided) and the request is retried up to `max_retries` times. A SourceUnavailable
+        exception is raised if the source's circuit breaker is open.
+
+        If the source's requests go through the proxy pool, the request waits on the chosen
+        proxy's rate limit bucket instead. A 429 or 503 only cools down that proxy, and a CAPTCHA
+        is retried through another proxy. The request is sent directly once no proxy is usable,
+        leaving any CAPTCHA to the caller.
+
+        Parameters:
+
+        source          The name of the source making the request (e.g. talos)
+        method          The HTTP method to use
+        url             The URL to request
+        captcha         Defaults to None. A function accepting the response that returns True
+                        if the response is a CAPTCHA challenge.
+        quota_statuses  Defaults to none. Status codes that mean the request's credentials used
+                        up their quota rather than that the source is overloaded. These are
+                        returned to the caller right away without backing off the whole source.
+        """
+        if source in self.sources:
+            kwargs.setdefault('timeout', self.sources[source].timeout)
         else:
-            return None
+            kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        breaker = self.breakers.get(source)
+        attempt = 0
+        challenged = []
+        while True:
+            if breaker:
+                breaker.wait()
+            proxy = None
+            if self.proxy_pool.handles(source):
+                proxy = self.proxy_pool.acquire(source, exclude=challenged)
+            if proxy:
+                kwargs['proxies'] = proxy.proxies
+            else:
+                kwargs.pop('proxies', None)
+                self.scheduler.wait(source)
+            response = self.transport.request(source, method, url, **kwargs)
+            response.proxy = proxy
+            if proxy and captcha and captcha(response):
+                self.proxy_pool.record_captcha(proxy, source)
+                challenged.append(proxy)
+                continue
+            if response.status_code in quota_statuses or response.status_code not in (429, 503) or not breaker or attempt >= self.max_retries:
+                if proxy and response.ok:
+                    self.proxy_pool.record_success(proxy, source)
+                return response
+            delay = breaker.backoff_delay(attempt, response.headers.get('Retry-After'))
+            if proxy:
+                print('[*] {} responded with status {} through proxy {}, so cooling it down for {:.1f} seconds.'.format(source, response.status_code, proxy, delay))
+                self.proxy_pool.cool_down(proxy, source, delay)
+            else:
+                print('[*] {} responded with status {}, so backing off for {:.1f} seconds.'.format(source, response.status_code, delay))
+                breaker.back_off(delay)
+            attempt += 1
+
+    def archive_response(self, source, key, response):
+        """Archive the raw body of a response the named source's results were parsed from. This
+        does nothing unless the `archive_responses` setting is enabled.
+        """
+        self.archive.store(source, key, response.content)
+
+    def mark_failed(self, source, key):
+        """Record that the named source's lookup for the domain name or IP address failed. The
+        source's results for that key are reported as not checked rather than empty.
+        """
+        with self.failures_lock:
+            self.failures.add((source, key))
+
+    def lookup_failed(self, source, key):
+        """Return True if the named source's lookup for the domain name or IP address failed."""
+        with self.failures_lock:
+            return (source, key) in self.failures
 
     def check_talos(self, domain):
         """Check the provided domain's category as determined by Cisco Talos."""
@@ -97,19 +284,17 @@ class DomainReview(object):
         headers = {'User-Agent': self.useragent, 
                    'Referer': 'https://www.talosintelligence.com/reputation_center/lookup?search=' + domain}
         try:
-            req = self.session.get(cisco_talos_uri.format(domain), headers=headers)
+            req = self._request('talos', 'get', cisco_talos_uri.format(domain), headers=headers)
             if req.ok:
-                json_data = req.json()
-                category = json_data['category']
-                if category:
-                    categories.append(json_data['category']['description'])
-                else:
-                    categories.append('Uncategorized')
+                categories = parse('talos', req.content)
+                self.archive_response('talos', domain, req)
             else:
                 print('[!] Cisco Talos check request failed. Talos did not return a 200 response.')
                 print('L.. Request returned status "{}"'.format(req.status_code))
+                self.mark_failed('talos', domain)
         except Exception as error:
                 print('[!] Cisco Talos request failed: {}'.format(error))
+                self.mark_failed('talos', domain)
         return categories
 
     def check_ibm_xforce(self, domain):
@@ -123,24 +308,18 @@ class DomainReview(object):
                    'Referer': xforce_uri}
         xforce_api_uri = 'https://api.xforce.ibmcloud.com/url/{}'.format(domain)
         try:
-            req = self.session.get(xforce_api_uri, headers=headers, verify=False)
-            if req.ok:
-                response = req.json()
-                if not response['result']['cats']:
-                    categories.append('Uncategorized')
-                else:
-                    temp = ''
-                    # Parse all dictionary keys and append to single string to get Category names
-                    for key in response['result']['cats']:
-                        categories.append(key)
+            req = self._request('xforce', 'get', xforce_api_uri, headers=headers, verify=False)
             # IBM X-Force returns a 404 with {"error":"Not found."} if the domain is unknown
-            elif req.status_code == 404:
-                categories.append('Unknown')
+            if req.ok or req.status_code == 404:
+                categories = parse('xforce', req.content)
+                self.archive_response('xforce', domain, req)
             else:
                 print('[!] IBM X-Force check request failed. X-Force did not return a 200 response.')
                 print('L.. Request returned status "{}"'.format(req.status_code))
-        except:
+                self.mark_failed('xforce', domain)
+        except Exception as error:
             print('[!] IBM X-Force request failed: {}'.format(error))
+            self.mark_failed('xforce', domain)
         return categories
 
     def check_fortiguard(self, domain):
@@ -151,7 +330,7 @@ class DomainReview(object):
                    'Origin': 'https://fortiguard.com', 
                    'Referer': 'https://fortiguard.com/webfilter'}
         try:
-            req = self.session.get(fortiguard_uri, headers=headers)
+            req = self._request('fortiguard', 'get', fortiguard_uri, headers=headers)
             if req.ok:
                 """
                 Example HTML result:
@@ -160,14 +339,15 @@ class DomainReview(object):
                         <div class="col-md-9 col-sm-12">
                             <h4 class="info_title">Category: Education</h4>
                 """
-                # TODO: Might be best to BS4 for this rather than regex
-                cat = re.findall('Category: (.*?)" />', req.text, re.DOTALL)
-                categories.append(cat[0])
+                categories = parse('fortiguard', req.content)
+                self.archive_response('fortiguard', domain, req)
             else:
                 print('[!] Fortiguard check request failed. Fortiguard did not return a 200 response.')
                 print('L.. Request returned status "{}"'.format(req.status_code))
+                self.mark_failed('fortiguard', domain)
         except Exception as error:
             print('[!] Fortiguard request failed: {}'.format(error))
+            self.mark_failed('fortiguard', domain)
         return categories
 
     def check_bluecoat(self, domain, ocr=True):
@@ -179,130 +359,225 @@ class DomainReview(object):
                    'Content-Type': 'application/json; charset=UTF-8', 
                    'Referer': 'https://sitereview.bluecoat.com/lookup'}
         try:
-            response = self.session.post(bluecoart_uri, headers=headers, json=post_data, verify=False)
-            root = etree.fromstring(response.text)
-            for node in root.xpath('//CategorizationResult//categorization//categorization//name'):
-                categories.append(node.text)
-            if 'captcha' in categories:
+            captchas_solved = self.captchas_solved
+            response = self._request('bluecoat', 'post', bluecoart_uri, headers=headers, json=post_data, verify=False,
+                                     captcha=self.is_bluecoat_captcha)
+            categories = parse('bluecoat', response.content)
+            if 'captcha' not in categories:
+                self.archive_response('bluecoat', domain, response)
+            else:
+                categories = []
                 if ocr:
                     # This request is also performed by a browser, but is not needed for our purposes
                     print('[*] Received a CAPTCHA challenge from Bluecoat...')
-                    captcha = self.solve_captcha('https://sitereview.bluecoat.com/resource/captcha.jpg', self.session)
-                    if captcha:
-                        b64captcha = base64.urlsafe_b64encode(captcha.encode('utf-8')).decode('utf-8')
-                        # Send CAPTCHA solution via GET since inclusion with the domain categorization request doesn't work anymore
-                        print('[*] Submitting an OCRed CAPTCHA text to Bluecoat...')
-                        captcha_solution_url = 'https://sitereview.bluecoat.com/resource/captcha-request/{0}'.format(b64captcha)
-                        response = self.session.get(url=captcha_solution_url, headers=headers, verify=False)
+                    if self.solve_bluecoat_captcha(captchas_solved, headers):
                         # Try the categorization request again
-                        response = self.session.post(url, headers=headers, json=postData, verify=False)
+                        response = self._request('bluecoat', 'post', bluecoart_uri, headers=headers, json=post_data, verify=False)
                         response_json = json.loads(response.text)
                         if 'errorType' in response_json:
                             print('[!] CAPTCHA submission was apparently incorrect!')
-                            categories = response_json['errorType']
+                            self.mark_failed('bluecoat', domain)
                         else:
                             print('[!] CAPTCHA submission was accepted!')
-                            categories = response_json['categorization'][0]['name']
+                            categories = parse('bluecoat', response.content)
+                            self.archive_response('bluecoat', domain, response)
+                            self.save_bluecoat_session()
                     else:
                         print('[!] Failed to solve BlueCoat CAPTCHA with OCR. Manually solve at: "https://sitereview.bluecoat.com/sitereview.jsp"')
+                        self.mark_failed('bluecoat', domain)
                 else:
                     print('[!] Failed to solve BlueCoat CAPTCHA with OCR. Manually solve at: "https://sitereview.bluecoat.com/sitereview.jsp"')
+                    self.mark_failed('bluecoat', domain)
         except Exception as error:
             print('[!] Bluecoat request failed: {0}'.format(error))
+            self.mark_failed('bluecoat', domain)
         return categories
 
-    def solve_captcha(self, url, session):
-        """Solve a Bluecoat CAPTCHA for the provided session."""
-        # Downloads CAPTCHA image and saves to current directory for OCR with Tesseract
-        # Returns CAPTCHA string or False if error occurred
-        jpeg = 'captcha.jpg'
+    def is_bluecoat_captcha(self, response):
+        """Return True if the Bluecoat response is a CAPTCHA challenge."""
+        try:
+            return 'captcha' in parse('bluecoat', response.content)
+        except Exception:
+            return False
+
+    def solve_bluecoat_captcha(self, captchas_solved, headers):
+        """Solve a Bluecoat CAPTCHA for the shared session and submit the solution. Only one
+        thread solves a CAPTCHA at a time. Returns True if a solution was submitted, including
+        when another thread submitted one while this thread was waiting.
+
+        Parameters:
+
+        captchas_solved     The value of `captchas_solved` when the caller's request was sent
+        headers             The headers to send with the solution
+        """
+        with self.captcha_lock:
+            if DomainReview.captchas_solved != captchas_solved:
+                return True
+            captcha = self.solve_captcha('https://sitereview.bluecoat.com/resource/captcha.jpg')
+            if not captcha:
+                return False
+            b64captcha = base64.urlsafe_b64encode(captcha.encode('utf-8')).decode('utf-8')
+            # Send CAPTCHA solution via GET since inclusion with the domain categorization request doesn't work anymore
+            print('[*] Submitting an OCRed CAPTCHA text to Bluecoat...')
+            captcha_solution_url = 'https://sitereview.bluecoat.com/resource/captcha-request/{0}'.format(b64captcha)
+            self._request('bluecoat', 'get', captcha_solution_url, headers=headers, verify=False)
+            DomainReview.captchas_solved += 1
+            return True
+
+    def solve_captcha(self, url):
+        """Solve a Bluecoat CAPTCHA for the current session. The image is downloaded into memory
+        and read with OCR in the CAPTCHA solver's process pool. Returns the CAPTCHA string or
+        False if an error occurred.
+        """
         headers = {'User-Agent':self.useragent}
         try:
-            response = session.get(url=url, headers=headers, verify=False, stream=True)
-            if response.status_code == 200:
-                with open(jpeg, 'wb') as f:
-                    response.raw.decode_content = True
-                    shutil.copyfileobj(response.raw, f)
-            else:
+            response = self._request('bluecoat', 'get', url, headers=headers, verify=False)
+            if response.status_code != 200:
                 print('[!] Failed to download the Bluecoat CAPTCHA.')
                 return False
-            # Perform basic OCR without additional image enhancement
-            text = pytesseract.image_to_string(Image.open(jpeg))
-            text = text.replace(" ", "").replace("[", "l").replace("'", "")
-            # Remove CAPTCHA file
-            try:
-                os.remove(jpeg)
-            except OSError:
-                pass
-            return text
+            return self.captcha_solver.solve(response.content)
         except Exception as error:
-            print('[!] Error processing the Bluecoat CAPTCHA.'.format(error))
+            print('[!] Error processing the Bluecoat CAPTCHA: {}'.format(error))
             return False
 
+    def load_bluecoat_session(self):
+        """Add the cookies of the last Bluecoat session with a solved CAPTCHA to the shared
+        session, so a CAPTCHA solved by another worker or an earlier run is reused.
+        """
+        cookies = self.cache.get('bluecoat_session', 'cookies')
+        for cookie in cookies or []:
+            self.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
+    def save_bluecoat_session(self):
+        """Cache the shared session's Bluecoat cookies after a CAPTCHA is accepted."""
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path}
+                   for cookie in self.session.cookies if cookie.domain.endswith('bluecoat.com')]
+        if cookies:
+            self.cache.set('bluecoat_session', 'cookies', cookies)
+
     def check_mxtoolbox(self, domain):
-        """Check if the provided domain is blacklisted as spam as determined by MX Toolkit."""
+        """Check if the provided domain is blacklisted as spam as determined by MX Toolkit.
+
+        The form's ASP.NET state tokens are fetched once and reused for every domain, so each
+        lookup is a single POST. The tokens are only fetched again if a lookup is rejected.
+        """
         issues = []
         mxtoolbox_url = 'https://mxtoolbox.com/Public/Tools/BrandReputation.aspx'
         headers = {'User-Agent': self.useragent, 
                    'Origin': mxtoolbox_url, 
                    'Referer': mxtoolbox_url}  
         try:
-            response = self.session.get(url=mxtoolbox_url, headers=headers)
-            soup = BeautifulSoup(response.content, 'lxml')
-            viewstate = soup.select('input[name=__VIEWSTATE]')[0]['value']
-            viewstategenerator = soup.select('input[name=__VIEWSTATEGENERATOR]')[0]['value']
-            eventvalidation = soup.select('input[name=__EVENTVALIDATION]')[0]['value']
-            data = {
-                    '__EVENTTARGET': '', 
-                    '__EVENTARGUMENT': '', 
-                    '__VIEWSTATE': viewstate, 
-                    '__VIEWSTATEGENERATOR': viewstategenerator, 
-                    '__EVENTVALIDATION': eventvalidation, 
-                    'ctl00$ContentPlaceHolder1$brandReputationUrl': domain, 
-                    'ctl00$ContentPlaceHolder1$brandReputationDoLookup': 'Brand Reputation Lookup', 
-                    'ctl00$ucSignIn$hfRegCode': 'missing', 
-                    'ctl00$ucSignIn$hfRedirectSignUp': '/Public/Tools/BrandReputation.aspx', 
-                    'ctl00$ucSignIn$hfRedirectLogin': '', 
-                    'ctl00$ucSignIn$txtEmailAddress': '', 
-                    'ctl00$ucSignIn$cbNewAccount': 'cbNewAccount', 
-                    'ctl00$ucSignIn$txtFullName': '', 
-                    'ctl00$ucSignIn$txtModalNewPassword': '', 
-                    'ctl00$ucSignIn$txtPhone': '', 
-                    'ctl00$ucSignIn$txtCompanyName': '', 
-                    'ctl00$ucSignIn$drpTitle': '', 
-                    'ctl00$ucSignIn$txtTitleName': '', 
-                    'ctl00$ucSignIn$txtModalPassword': ''
-            }
-            response = self.session.post(url=mxtoolbox_url, headers=headers, data=data)
-            soup = BeautifulSoup(response.content, 'lxml')
-            if soup.select('div[id=ctl00_ContentPlaceHolder1_noIssuesFound]'):
-                issues.append('No issues found')
-            else:
-                if soup.select('div[id=ctl00_ContentPlaceHolder1_googleSafeBrowsingIssuesFound]'):
-                    issues.append('Google SafeBrowsing Issues Found.')
-                if soup.select('div[id=ctl00_ContentPlaceHolder1_phishTankIssuesFound]'):
-                    issues.append('PhishTank Issues Found')
+            for attempt in range(2):
+                tokens, tokens_fetched = self.get_mxtoolbox_tokens(mxtoolbox_url, headers)
+                data = {
+                        '__EVENTTARGET': '', 
+                        '__EVENTARGUMENT': '', 
+                        '__VIEWSTATE': tokens['__VIEWSTATE'], 
+                        '__VIEWSTATEGENERATOR': tokens['__VIEWSTATEGENERATOR'], 
+                        '__EVENTVALIDATION': tokens['__EVENTVALIDATION'], 
+                        'ctl00$ContentPlaceHolder1$brandReputationUrl': domain, 
+                        'ctl00$ContentPlaceHolder1$brandReputationDoLookup': 'Brand Reputation Lookup', 
+                        'ctl00$ucSignIn$hfRegCode': 'missing', 
+                        'ctl00$ucSignIn$hfRedirectSignUp': '/Public/Tools/BrandReputation.aspx', 
+                        'ctl00$ucSignIn$hfRedirectLogin': '', 
+                        'ctl00$ucSignIn$txtEmailAddress': '', 
+                        'ctl00$ucSignIn$cbNewAccount': 'cbNewAccount', 
+                        'ctl00$ucSignIn$txtFullName': '', 
+                        'ctl00$ucSignIn$txtModalNewPassword': '', 
+                        'ctl00$ucSignIn$txtPhone': '', 
+                        'ctl00$ucSignIn$txtCompanyName': '', 
+                        'ctl00$ucSignIn$drpTitle': '', 
+                        'ctl00$ucSignIn$txtTitleName': '', 
+                        'ctl00$ucSignIn$txtModalPassword': ''
+                }
+                response = self._request('mxtoolbox', 'post', mxtoolbox_url, headers=headers, data=data)
+                try:
+                    if response.status_code != 200:
+                        raise ValueError('MXToolbox returned status {}'.format(response.status_code))
+                    issues = parse('mxtoolbox', response.content)
+                    self.archive_response('mxtoolbox', domain, response)
+                    return issues
+                except ValueError as error:
+                    # Expired or rejected tokens come back as an error page without any results
+                    print('[*] MXToolbox rejected the lookup for {} ({}), so fetching new form tokens.'.format(domain, error))
+                    self.expire_mxtoolbox_tokens(tokens_fetched)
+            raise ValueError('MXToolbox rejected the lookup with new form tokens')
         except Exception as error:
             print('[!] Error retrieving Google SafeBrowsing and PhishTank reputation!')
+            self.mark_failed('mxtoolbox', domain)
         return issues
 
+    def get_mxtoolbox_tokens(self, mxtoolbox_url, headers):
+        """Return the ASP.NET state tokens for the MXToolbox Brand Reputation form and the number
+        of times tokens have been fetched. The tokens are only fetched if the shared session
+        doesn't have any yet.
+
+        Parameters:
+
+        mxtoolbox_url       The URL of the Brand Reputation form
+        headers             The headers to send with the request
+        """
+        with self.mxtoolbox_lock:
+            if DomainReview.mxtoolbox_tokens is None:
+                response = self._request('mxtoolbox', 'get', mxtoolbox_url, headers=headers)
+                DomainReview.mxtoolbox_tokens = parse('mxtoolbox_form', response.content)
+                DomainReview.mxtoolbox_tokens_fetched += 1
+            return DomainReview.mxtoolbox_tokens, DomainReview.mxtoolbox_tokens_fetched
+
+    def expire_mxtoolbox_tokens(self, tokens_fetched):
+        """Throw away the cached MXToolbox form tokens after they were rejected, unless another
+        thread already replaced them.
+
+        Parameters:
+
+        tokens_fetched      The value of `mxtoolbox_tokens_fetched` when the rejected tokens were used
+        """
+        with self.mxtoolbox_lock:
+            if DomainReview.mxtoolbox_tokens_fetched == tokens_fetched:
+                DomainReview.mxtoolbox_tokens = None
+
     def check_cymon(self, target):
         """Get reputation data from Cymon.io for target IP address. This returns two dictionaries
         for domains and security events.
 
         A Cymon API key is not required, but is recommended.
+
+        Returns True if the IP address is flagged, False if it is not, and None if the request
+        failed so a failure is never mistaken for (or cached as) a clean result.
         """
         try:
-            req = self.session.get(url='https://cymon.io/' + target, verify=False)
+            req = self._request('cymon', 'get', 'https://cymon.io/' + target, verify=False)
             if req.status_code == 200:
-                if 'IP Not Found' in req.text:
-                    return False
-                else:
-                    return True
+                flagged = parse('cymon', req.content)
+                self.archive_response('cymon', target, req)
+                return flagged
             else:
-                return False
+                self.mark_failed('cymon', target)
+                return None
         except Exception:
-            return False
+            self.mark_failed('cymon', target)
+            return None
+
+    def check_ip_addresses(self, addresses, executor):
+        """Check the reputation of the provided IP addresses and return a dictionary of each
+        address and its result. Each address is only looked up once per run, even if it appears
+        for many domains, and the lookups run at the same time.
+
+        Parameters:
+
+        addresses       A list of IP addresses
+        executor        A ThreadPoolExecutor used for the lookups
+        """
+        lookups = {}
+        # Skip the lookups if the IP address source is not part of this run
+        if 'cymon' not in self.sources:
+            return {}
+        with self.ip_lookups_lock:
+            for address in set(addresses):
+                if address not in self.ip_lookups:
+                    self.ip_lookups[address] = executor.submit(self.run_source, 'cymon', address)
+                lookups[address] = self.ip_lookups[address]
+        return {address: lookup.result() for address, lookup in lookups.items()}
 
     def check_opendns(self, domain):
         """Check the provided domain's category as determined by the OpenDNS community."""
@@ -310,19 +585,20 @@ class DomainReview(object):
         opendns_uri = 'https://domain.opendns.com/{}'
         headers = {'User-Agent':self.useragent}
         try:
-            response = self.session.get(opendns_uri.format(domain), headers=headers, verify=False)
-            soup = BeautifulSoup(response.content, 'lxml')
-            tags = soup.find('span', {'class': 'normal'})
-            if tags:
-                categories = tags.text.strip().split(', ')
-            else:
-                categories.append('No Tags')
+            response = self._request('opendns', 'get', opendns_uri.format(domain), headers=headers, verify=False)
+            categories = parse('opendns', response.content)
+            self.archive_response('opendns', domain, response)
         except Exception as error:
             print('[!] OpenDNS request failed: {0}'.format(error))
+            self.mark_failed('opendns', domain)
         return categories
 
     def check_trendmicro(self, domain):
-        """Check the provided domain's category as determined by the Trend Micro."""
+        """Check the provided domain's category as determined by the Trend Micro.
+
+        The landing page is only requested to warm up the shared session, so it is requested
+        once and the session is reused until TrendMicro rejects it or redirects to its CAPTCHA.
+        """
         categories = []
         trendmicro_uri = 'https://global.sitesafety.trendmicro.com/'
         trendmicro_stage_1_uri = 'https://global.sitesafety.trendmicro.com/lib/idn.php'
@@ -353,139 +629,345 @@ class DomainReview(object):
                         'getinfo': 'Check Now'
                        }
         try:
-            response = self.session.get(trendmicro_uri, headers=headers)
-            response = self.session.post(trendmicro_stage_1_uri, headers=headers_stage_1, data=data_stage_1)
-            response = self.session.post(trendmicro_stage_2_uri, headers=headers_stage_2, data=data_stage_2)
-            # Check if session was redirected to /captcha.php
-            if 'captcha' in response.url:
-                print('[!] TrendMicro responded with a reCAPTCHA, so cannot proceed with TrendMicro.')
-                print('L.. You can try solving it yourself: https://global.sitesafety.trendmicro.com/captcha.php')
-            else:
-                soup = BeautifulSoup(response.content, 'lxml')
-                tags = soup.find('div', {'class': 'labeltitlesmallresult'})
-                if tags:
-                    categories = tags.text.strip().split(', ')
+            for attempt in range(2):
+                warmups = self.warm_up_trendmicro(trendmicro_uri, headers)
+                response = self._request('trendmicro', 'post', trendmicro_stage_1_uri, headers=headers_stage_1, data=data_stage_1)
+                if response.status_code == 200:
+                    response = self._request('trendmicro', 'post', trendmicro_stage_2_uri, headers=headers_stage_2, data=data_stage_2,
+                                             captcha=lambda response: 'captcha' in response.url)
+                # Check if session was redirected to /captcha.php or rejected
+                if 'captcha' not in response.url and response.status_code == 200:
+                    categories = parse('trendmicro', response.content)
+                    self.archive_response('trendmicro', domain, response)
+                    break
+                # Warm up a new session before trying again
+                self.expire_trendmicro_session(warmups)
+                if attempt == 0:
+                    print('[*] TrendMicro rejected the session for {}, so warming up a new session.'.format(domain))
+                elif 'captcha' in response.url:
+                    print('[!] TrendMicro responded with a reCAPTCHA, so cannot proceed with TrendMicro.')
+                    print('L.. You can try solving it yourself: https://global.sitesafety.trendmicro.com/captcha.php')
+                    self.mark_failed('trendmicro', domain)
                 else:
-                    categories.append('Uncategorized')
+                    print('[!] TrendMicro rejected the session again. Request returned status "{}"'.format(response.status_code))
+                    self.mark_failed('trendmicro', domain)
         except Exception as error:
             print('[!] Trend Micro request failed: {0}'.format(error))
+            self.mark_failed('trendmicro', domain)
         return categories
 
+    def warm_up_trendmicro(self, trendmicro_uri, headers):
+        """Visit the TrendMicro landing page to set up the shared session's cookies, unless the
+        session was already warmed up. Returns the number of times the session has been warmed up.
+
+        Parameters:
+
+        trendmicro_uri      The URL of the TrendMicro landing page
+        headers             The headers to send with the request
+        """
+        with self.trendmicro_lock:
+            if not DomainReview.trendmicro_warm:
+                self._request('trendmicro', 'get', trendmicro_uri, headers=headers)
+                DomainReview.trendmicro_warm = True
+                DomainReview.trendmicro_warmups += 1
+            return DomainReview.trendmicro_warmups
+
+    def expire_trendmicro_session(self, warmups):
+        """Mark the TrendMicro session as needing a new warm-up after it was rejected, unless
+        another thread already warmed up a new one.
+
+        Parameters:
+
+        warmups         The value returned by `warm_up_trendmicro()` for the rejected session
+        """
+        with self.trendmicro_lock:
+            if DomainReview.trendmicro_warmups == warmups:
+                DomainReview.trendmicro_warm = False
+
     def download_malware_domains(self):
-        """Downloads the malwaredomains.com list of malicious domains."""
+        """Downloads the malwaredomains.com list of malicious domains. The list is saved to disk
+        and is only downloaded again if it has changed. Returns a MalwareDomainList that can be
+        searched with `in` or None if no list is available.
+        """
         headers = {'User-Agent':self.useragent}
-        response = self.session.get(url=self.malwaredomains_url, headers=headers, verify=False)
-        malware_domains = response.text
-        if response.status_code == 200:
+        malware_domains = MalwareDomainList()
+        if malware_domains.update(lambda method, url, **kwargs: self._request('malwaredomains', method, url, **kwargs),
+                                  self.malwaredomains_url, headers=headers):
             return malware_domains
         else:
-            print('[!] Error reaching: {}, Status: {}'.format(self.malwaredomains_url, response.status_code))
             return None
 
-    def check_domain_status(self):
-        """Check the status of each domain in the provided list collected from the Domain model.
-        Each domain will be checked to ensure the domain is not flagged/blacklisted. A domain
-        will be considered burned if VirusTotal returns detections for the domain or one of the
-        domain's categories appears in the list of bad categories.
+    def run_source(self, name, key):
+        """Run the named source's check for the provided domain name or IP address and return
+        the results. A cached result is used if one is still fresh. Otherwise the lookup waits
+        for a free slot under the source's concurrency limit.
+
+        Failed lookups count toward the source's circuit breaker and are not cached. Once the
+        breaker is open, the source is skipped and the lookup is marked as failed.
 
-        VirusTotal allows 4 requests every 1 minute. A minimum of 20 seconds is recommended to
-        allow for some consideration on the service.
+        Parameters:
 
+        name            The name of a source in the registry (e.g. talos)
+        key             The domain name or IP address to check
         """
-        lab_results = {}
-        malware_domains = self.download_malware_domains()
-        for domain in self.domain_queryset:
-            print('[+] Starting update of {}'.format(domain.name))
-            burned_dns = False
-            domain_categories = []
-            # Sort the domain information from queryset
-            domain_name = domain.name
-            health = domain.health_status
-            # Check if domain is known to be burned and skip it if so
-            # This just saves time and operators can edit a domain and set status to `Healthy` as needed
-            # The domain will be included in the next update after the edit
-            if health != 'Healthy':
-                burned = False
-            else:
+        source = self.sources[name]
+        breaker = self.breakers[name]
+        if not self.force_refresh:
+            cached = self.cache.get(name, key)
+            if cached is not None:
+                return cached
+        if not breaker.allow():
+            self.mark_failed(name, key)
+            return None
+        # Built-in sources name one of this class's check methods
+        if isinstance(source.check, str):
+            check = getattr(self, source.check)
+        else:
+            check = lambda key: source.check(self, key)
+        with source.semaphore:
+            result = check(key)
+        if self.lookup_failed(name, key):
+            if breaker.record_failure():
+                print('[!] {} failed {} times in a row, so it will be skipped for the rest of this run.'.format(source.label, breaker.threshold))
+            return result
+        breaker.record_success()
+        # False is a real answer (e.g. an IP address that is not flagged), so it is cached too
+        if result or result is False:
+            self.cache.set(name, key, result)
+        return result
+
+    def count_detections(self, detections):
+        """Return the number of VirusTotal detections. Reports store the count, but results cached
+        before that hold the full list.
+        """
+        if isinstance(detections, list):
+            return len(detections)
+        return detections or 0
+
+    def review_domain(self, domain, malware_domains, executor):
+        """Review a single domain and return its results dictionary. The independent source
+        lookups are submitted to the provided executor so they run at the same time.
+
+        The results for sources that were not part of this run are set to None, so the stored
+        values for those sources can be left alone. Sources whose lookup failed (or whose circuit
+        breaker is open) are marked as not checked.
+
+        Parameters:
+
+        domain              The Domain object to be reviewed
+        malware_domains     The malwaredomains.com list returned by download_malware_domains()
+        executor            A ThreadPoolExecutor used for the individual source lookups
+        """
+        print('[+] Starting update of {}'.format(domain.name))
+        burned = False
+        burned_dns = False
+        burned_explanations = []
+        domain_categories = []
+        domain_name = domain.name
+        # Start every independent lookup right away
+        lookups = OrderedDict()
+        for name, source in self.sources.items():
+            if source.scope == 'domain':
+                lookups[name] = executor.submit(self.run_source, name, domain_name)
+        # Check if domain is flagged for malware
+        if malware_domains:
+            if domain_name in malware_domains:
+                print('[!] {}: Identified as a known malware domain (malwaredomains.com)!'.format(domain_name))
                 burned = True
-            if not burned:
-                burned_explanations = []
-                # Check if domain is flagged for malware
-                if malware_domains:
-                    if domain_name in malware_domains:
-                        print('[!] {}: Identified as a known malware domain (malwaredomains.com)!'.format(domain_name))
-                        burned = True
-                        burned_explanations.append('Flagged by malwaredomains.com')
-                # Check domain name with VirusTotal
-                vt_results = self.check_virustotal(domain_name)
-                if 'categories' in vt_results:
-                    domain_categories = vt_results['categories']
-                # Check if VirusTotal has any detections for URLs or samples
-                if 'detected_downloaded_samples' in vt_results:
-                    if len(vt_results['detected_downloaded_samples']) > 0:
-                        print('[!] {}: Identified as having a downloaded sample on VirusTotal!'.format(domain_name))
-                        burned = True
-                        burned_explanations.append('Tied to a VirusTotal detected malware sample')
-                if 'detected_urls' in vt_results:
-                    if len(vt_results['detected_urls']) > 0:
-                        print('[!] {}: Identified as having a URL detection on VirusTotal!'.format(domain_name))
-                        burned = True
-                        burned_explanations.append('Tied to a VirusTotal detected URL')
-                # Get passive DNS results from VirusTotal JSON
-                ip_addresses = []
-                if 'resolutions' in vt_results:
-                    for address in vt_results['resolutions']:
-                        ip_addresses.append({'address':address['ip_address'], 'timestamp':address['last_resolved'].split(' ')[0]})
-                bad_addresses = []
-                for address in ip_addresses:
-                    if self.check_cymon(address['address']):
-                        burned_dns = True
-                        bad_addresses.append(address['address'] + '/' + address['timestamp'])
-                if burned_dns:
-                    print('[*] {}: Identified as pointing to suspect IP addresses (VirusTotal passive DNS).'.format(domain_name))
-                    health_dns = 'Flagged DNS ({})'.format(', '.join(bad_addresses))
-                else:
-                    health_dns = "Healthy"
-                # Collect categories from the other sources
-                xforce_results = self.check_ibm_xforce(domain_name)
-                domain_categories.extend(xforce_results)
-                talos_results = self.check_talos(domain_name)
-                domain_categories.extend(talos_results)
-                bluecoat_results = self.check_bluecoat(domain_name)
-                domain_categories.extend(bluecoat_results)
-                fortiguard_results = self.check_fortiguard(domain_name)
-                domain_categories.extend(fortiguard_results)
-                opendns_results = self.check_opendns(domain_name)
-                domain_categories.extend(opendns_results)
-                trendmicro_results = self.check_trendmicro(domain_name)
-                domain_categories.extend(trendmicro_results)
-                mxtoolbox_results = self.check_mxtoolbox(domain_name)
-                domain_categories.extend(domain_categories)
-                # Make categories unique
-                domain_categories = list(set(domain_categories))
-                # Check if any categopries are suspect
-                bad_categories = []
-                for category in domain_categories:
-                    if category.lower() in self.blacklisted:
-                        bad_categories.append(category.capitalize())
-                if bad_categories:
+                burned_explanations.append('Flagged by malwaredomains.com')
+        # Check domain name with VirusTotal
+        health_dns = None
+        vt_categories = None
+        if 'virustotal' in lookups:
+            vt_results = lookups.pop('virustotal').result() or {}
+            if 'categories' in vt_results:
+                domain_categories = vt_results['categories']
+            if self.lookup_failed('virustotal', domain_name):
+                vt_categories = NOT_CHECKED
+            else:
+                vt_categories = ', '.join(vt_results.get('categories', []))
+            # Check if VirusTotal has any detections for URLs or samples
+            if 'detected_downloaded_samples' in vt_results:
+                if self.count_detections(vt_results['detected_downloaded_samples']) > 0:
+                    print('[!] {}: Identified as having a downloaded sample on VirusTotal!'.format(domain_name))
+                    burned = True
+                    burned_explanations.append('Tied to a VirusTotal detected malware sample')
+            if 'detected_urls' in vt_results:
+                if self.count_detections(vt_results['detected_urls']) > 0:
+                    print('[!] {}: Identified as having a URL detection on VirusTotal!'.format(domain_name))
                     burned = True
-                    burned_explanations.append('Tagged with a bad category')
-                # Assemble the dictionary to return for this domain
-                lab_results[domain] = {}
-                lab_results[domain]['categories'] = {}
-                lab_results[domain]['burned'] = burned
-                lab_results[domain]['burned_explanation'] = ', '.join(burned_explanations)
-                lab_results[domain]['health_dns'] = health_dns
-                lab_results[domain]['categories']['all'] = ', '.join(bad_categories)
-                lab_results[domain]['categories']['bad'] = ', '.join(domain_categories)
-                lab_results[domain]['categories']['talos'] = ', '.join(talos_results)
-                lab_results[domain]['categories']['xforce'] = ', '.join(xforce_results)
-                lab_results[domain]['categories']['opendns'] = ', '.join(opendns_results)
-                lab_results[domain]['categories']['bluecoat'] = ', '.join(bluecoat_results)
-                lab_results[domain]['categories']['mxtoolbox'] = ', '.join(mxtoolbox_results)
-                lab_results[domain]['categories']['fortiguard'] = ', '.join(fortiguard_results)
-                lab_results[domain]['categories']['trendmicro'] = ', '.join(trendmicro_results)
-                # Sleep for a while for VirusTotal's API
-                sleep(self.request_delay)
+                    burned_explanations.append('Tied to a VirusTotal detected URL')
+            # Get passive DNS results from VirusTotal JSON
+            ip_addresses = []
+            if 'resolutions' in vt_results:
+                for address in vt_results['resolutions']:
+                    ip_addresses.append({'address':address['ip_address'], 'timestamp':address['last_resolved'].split(' ')[0]})
+            bad_addresses = []
+            ip_reputation = self.check_ip_addresses([address['address'] for address in ip_addresses], executor)
+            for address in ip_addresses:
+                if ip_reputation.get(address['address']):
+                    burned_dns = True
+                    bad_addresses.append(address['address'] + '/' + address['timestamp'])
+            if burned_dns:
+                print('[*] {}: Identified as pointing to suspect IP addresses (VirusTotal passive DNS).'.format(domain_name))
+                health_dns = 'Flagged DNS ({})'.format(', '.join(bad_addresses))
+            # An address that could not be looked up might be flagged, so the domain is not
+            # reported as healthy unless every lookup succeeded
+            elif self.lookup_failed('virustotal', domain_name) or any(
+                    self.lookup_failed('cymon', address['address']) for address in ip_addresses):
+                health_dns = NOT_CHECKED
+            # Without the IP address source the resolutions were never checked, so the stored
+            # DNS health is kept
+            elif 'cymon' not in self.sources:
+                health_dns = None
+            else:
+                health_dns = "Healthy"
+        # Collect categories from the other sources
+        source_results = {}
+        for name, lookup in lookups.items():
+            source_results[name] = lookup.result() or []
+            # Results from a failed lookup are partial (or a CAPTCHA error), so they are not used
+            if self.lookup_failed(name, domain_name):
+                source_results[name] = None
+            elif self.sources[name].categorizes:
+                domain_categories.extend(source_results[name])
+        # Make categories unique
+        domain_categories = list(set(domain_categories))
+        # Check if any categopries are suspect
+        bad_categories = []
+        for category in domain_categories:
+            if Category.normalize(category) in self.blacklisted:
+                bad_categories.append(category.capitalize())
+        if bad_categories:
+            burned = True
+            burned_explanations.append('Tagged with a bad category')
+        # Assemble the dictionary to return for this domain
+        results = {}
+        results['categories'] = {}
+        results['burned'] = burned
+        results['burned_explanation'] = ', '.join(burned_explanations)
+        results['health_dns'] = health_dns
+        results['categories']['all'] = ', '.join(bad_categories)
+        results['categories']['bad'] = ', '.join(domain_categories)
+        for name, source in SOURCES.items():
+            if source.scope == 'domain' and name != 'virustotal':
+                if name not in source_results:
+                    results['categories'][name] = None
+                elif source_results[name] is None:
+                    results['categories'][name] = NOT_CHECKED
+                else:
+                    results['categories'][name] = ', '.join(source_results[name])
+        # VirusTotal has no category field, but its categories are still linked for searches
+        results['categories']['virustotal'] = vt_categories
+        return results
+
+    def domain_chunks(self):
+        """Yield the domains in the provided queryset in chunks of `chunk_size`. Only the IDs are
+        loaded up front, so memory use stays flat no matter how many domains are in the run and
+        results saved during the run can't shift the rows being read. A list of Domain objects
+        is split into chunks as is.
+        """
+        if isinstance(self.domain_queryset, (list, tuple)):
+            for index in range(0, len(self.domain_queryset), self.chunk_size):
+                yield self.domain_queryset[index:index + self.chunk_size]
+            return
+        domain_ids = list(self.domain_queryset.values_list('id', flat=True))
+        for index in range(0, len(domain_ids), self.chunk_size):
+            chunk = domain_ids[index:index + self.chunk_size]
+            domains = Domain.objects.in_bulk(chunk)
+            # Keep the queryset's order
+            yield [domains[domain_id] for domain_id in chunk if domain_id in domains]
+
+    def timed_review_domain(self, domain, malware_domains, executor):
+        """Review a single domain with `review_domain()` and add the time it took to the
+        estimate of each domain's review time.
+        """
+        start = monotonic()
+        try:
+            return self.review_domain(domain, malware_domains, executor)
+        finally:
+            self.record_domain_cost(monotonic() - start)
+
+    def record_domain_cost(self, seconds):
+        """Add a domain's review time to the moving average of each domain's review time. The
+        review time includes every source's latency and rate limit waits.
+        """
+        with self.domain_cost_lock:
+            if self.domain_cost is None:
+                self.domain_cost = seconds
+            else:
+                self.domain_cost = 0.7 * self.domain_cost + 0.3 * seconds
+
+    def out_of_time(self):
+        """Return True if a domain started now is not expected to finish before the deadline.
+        Until a domain has finished, only the deadline itself is checked.
+        """
+        if self.deadline is None:
+            return False
+        return monotonic() + (self.domain_cost or 0) > self.deadline
+
+    def finished_reviews(self, reviews):
+        """Wait for at least one of the submitted reviews to finish and yield a (domain, results)
+        tuple for each finished review, removing it from the provided dictionary.
+        """
+        done, _ = wait(reviews, return_when=FIRST_COMPLETED)
+        for review in done:
+            domain = reviews.pop(review)
+            try:
+                results = review.result()
+            except Exception as error:
+                print('[!] Review of {} failed: {}'.format(domain.name, error))
+                continue
+            yield domain, results
+
+    def stream_domain_status(self):
+        """Review each domain in the provided queryset and yield a (domain, results) tuple as soon
+        as each domain's review finishes, so the results can be saved right away. A domain will
+        be considered burned if VirusTotal returns detections for the domain or one of the
+        domain's categories appears in the list of bad categories.
+
+        Up to `max_workers` domains are reviewed at the same time and each domain's source
+        lookups run in parallel. Every source waits on its own rate limit bucket, so VirusTotal's
+        4 requests per minute quota does not slow down the other sources.
+
+        With a time budget, the domains are started in the queryset's order while they are
+        expected to finish in time. The rest are skipped and their names are left in `deferred`.
+        """
+        malware_domains = self.download_malware_domains()
+        if self.time_budget is not None:
+            self.deadline = monotonic() + self.time_budget
+        self.deferred = []
+        # Each domain in flight runs one lookup per source, so size the lookup pool to match
+        with ThreadPoolExecutor(max_workers=self.max_workers * max(1, len(self.sources))) as source_executor:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as domain_executor:
+                reviews = {}
+                for chunk in self.domain_chunks():
+                    for domain in chunk:
+                        # Only `max_workers` domains are in flight, so the run can stop starting new ones in time
+                        while len(reviews) >= self.max_workers:
+                            yield from self.finished_reviews(reviews)
+                        if self.out_of_time():
+                            self.deferred.append(domain.name)
+                            continue
+                        reviews[domain_executor.submit(self.timed_review_domain, domain, malware_domains, source_executor)] = domain
+                while reviews:
+                    yield from self.finished_reviews(reviews)
+        if self.domain_cost is not None:
+            type(self).domain_cost_estimate = self.domain_cost
+        if self.deferred:
+            print('[*] Ran out of time, so {} domains were deferred: {}'.format(len(self.deferred), ', '.join(self.deferred)))
+        self.transport.print_stats()
+        if self.archive.enabled:
+            purged = self.archive.purge()
+            if purged:
+                print('[*] Purged {} archived responses older than {} days.'.format(purged, self.archive.retention))
+
+    def check_domain_status(self):
+        """Check the status of each domain in the provided list collected from the Domain model
+        and return a dictionary of the results keyed by Domain. Use `stream_domain_status()` to
+        handle each domain's results as they come in instead.
+        """
+        lab_results = {}
+        for domain, results in self.stream_domain_status():
+            lab_results[domain] = results
         return lab_results
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the registry of reputation sources checked by DomainReview. Each source
+declares how it is checked, where its results are stored, and its own request timeout,
+concurrency limit, and enabled flag. The defaults can be overridden in settings:
+
+    DOMAINCHECK_CONFIG = {
+        'sources': {
+            'bluecoat': {'timeout': 20, 'concurrency': 1},
+            'trendmicro': {'enabled': False},
+        },
+    }
+
+A new source can be added by registering it with `register_source()`. The `check` function is
+called with the DomainReview object and the domain name (or IP address) and should return a list
+of categories, following the same conventions as the built-in checks. The built-in sources use
+the name of a DomainReview check method instead of a function.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# Timeout (in seconds) for requests that do not belong to a registered source
+DEFAULT_TIMEOUT = 30
+
+
+class ReputationSource(object):
+    """Class representing a single reputation source."""
+
+    def __init__(self, name, label, check, field=None, scope='domain', categorizes=True,
+                 timeout=DEFAULT_TIMEOUT, concurrency=4, enabled=True):
+        """Everything that needs to be setup when a new ReputationSource object is created goes here.
+
+        Parameters:
+
+        name            Short name used in settings, task arguments, and results (e.g. talos)
+        label           Name displayed to users (e.g. Cisco Talos)
+        check           Function accepting (DomainReview, domain) that returns the source's results
+                        or the name of a DomainReview check method
+        field           Name of the Domain model field that stores the results, if any
+        scope           Either `domain` for sources checked once per domain or `ip` for sources
+                        checked for the domain's passive DNS addresses
+        categorizes     Whether the results are categories that count toward the domain's health
+        timeout         Seconds to wait for each of the source's web requests
+        concurrency     Maximum number of lookups for this source running at the same time
+        enabled         Whether the source is checked by default
+        """
+        self.name = name
+        self.label = label
+        self.check = check
+        self.field = field
+        self.scope = scope
+        self.categorizes = categorizes
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.enabled = enabled
+        self.semaphore = threading.BoundedSemaphore(concurrency)
+
+    def configure(self, overrides):
+        """Return a copy of the source with the provided setting overrides applied."""
+        source = copy.copy(self)
+        for option in ('timeout', 'concurrency', 'enabled'):
+            if option in overrides:
+                setattr(source, option, overrides[option])
+        source.semaphore = threading.BoundedSemaphore(max(1, int(source.concurrency)))
+        return source
+
+    def __str__(self):
+        """String for representing the source."""
+        return self.label
+
+
+# The registry of every known source, in the order they are displayed
+SOURCES = OrderedDict()
+
+
+def register_source(source):
+    """Add a ReputationSource to the registry, replacing any source with the same name."""
+    SOURCES[source.name] = source
+    return source
+
+
+def get_sources(names=None):
+    """Return an ordered dictionary of the sources to check with settings overrides applied.
+
+    Parameters:
+
+    names           Defaults to None. A list of source names to limit the run to. When not
+                    provided, every enabled source is returned.
+    """
+    try:
+        overrides = settings.DOMAINCHECK_CONFIG['sources']
+    except Exception:
+        overrides = {}
+    sources = OrderedDict()
+    for name, source in SOURCES.items():
+        source = source.configure(overrides.get(name, {}))
+        if names is not None:
+            if name in names:
+                sources[name] = source
+        elif source.enabled:
+            sources[name] = source
+    return sources
+
+
+# Register the built-in reputation sources
+register_source(ReputationSource('virustotal', 'VirusTotal', 'check_virustotal', categorizes=False))
+register_source(ReputationSource('cymon', 'Cymon (passive DNS)', 'check_cymon', scope='ip', categorizes=False, timeout=15))
+register_source(ReputationSource('xforce', 'IBM X-Force', 'check_ibm_xforce', field='ibm_xforce_cat', timeout=20))
+register_source(ReputationSource('talos', 'Cisco Talos', 'check_talos', field='talos_cat', timeout=20))
+register_source(ReputationSource('bluecoat', 'Bluecoat', 'check_bluecoat', field='bluecoat_cat', concurrency=1))
+register_source(ReputationSource('fortiguard', 'Fortiguard', 'check_fortiguard', field='fortiguard_cat', timeout=20))
+register_source(ReputationSource('opendns', 'OpenDNS', 'check_opendns', field='opendns_cat', timeout=20))
+register_source(ReputationSource('trendmicro', 'TrendMicro', 'check_trendmicro', field='trendmicro_cat', concurrency=2))
+register_source(ReputationSource('mxtoolbox', 'MXToolbox', 'check_mxtoolbox', field='mx_toolbox_status', categorizes=False, concurrency=2))
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains a local stub server that imitates the endpoints and response formats of
+every reputation source, so DomainReview can be benchmarked and tested without network access.
+
+The transport sends every request to the stub when its `stub_url` option is set. The original
+host becomes the first part of the path (e.g. http://127.0.0.1:8123/fortiguard.com/webfilter?q=),
+so the stub can tell which source a request was meant for.
+
+Each domain's name selects how the sources respond to it:
+
+    captcha-    Bluecoat and TrendMicro answer with their CAPTCHA challenges
+    missing-    Every source answers with a 404
+    limited-    Every source answers the first request with a 429 and a Retry-After header
+    slow-       Every response is delayed by the server's `slow_delay`
+
+Every other domain gets a normal, clean response from each source after the server's `delay`.
+
+StubProxyServer is a stand-in outbound proxy for testing the proxy pool. It forwards requests to
+the stub and can be told to make Bluecoat and TrendMicro answer every request it forwards with
+a CAPTCHA, like a proxy whose IP address has been flagged.
+"""
+
+import os
+import json
+import time
+import threading
+import http.client
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# Directory holding the saved source responses
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Prefixes of the domain names that trigger each scenario
+SCENARIOS = ('captcha', 'missing', 'limited', 'slow')
+
+
+def read_fixture(name):
+    """Return the contents of the named fixture as bytes."""
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as fixture:
+        return fixture.read()
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """Request handler that answers like the reputation source the request was meant for."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        """Keep the stub quiet."""
+        pass
+
+    def do_GET(self):
+        self.handle_source_request(b'')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.handle_source_request(self.rfile.read(length))
+
+    def send(self, status, body=b'', content_type='text/html', headers=None):
+        """Send a complete response."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_source_request(self, body):
+        """Work out the source and scenario for the request and send the response."""
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip('/').partition('/')
+        path = '/' + path
+        text = unquote(parts.path + '?' + parts.query) + ' ' + unquote(body.decode('utf-8', 'replace'))
+        # A stand-in proxy can force a scenario for every request it forwards
+        scenario = self.headers.get('X-Stub-Scenario') or self.server.scenario(text)
+        self.server.count(host)
+        if scenario == 'slow':
+            time.sleep(self.server.slow_delay)
+        elif self.server.delay:
+            time.sleep(self.server.delay)
+        if scenario == 'missing':
+            return self.send(404, '{"error":"Not found."}', 'application/json')
+        if scenario == 'limited' and self.server.first_request(host, text):
+            return self.send(429, 'Too Many Requests', 'text/plain', {'Retry-After': '1'})
+        handler = getattr(self, 'respond_' + host.replace('.', '_').replace('-', '_'), None)
+        if handler is None:
+            return self.send(404, 'Unknown stub host: {}'.format(host), 'text/plain')
+        handler(path, parse_qs(parts.query), body, scenario)
+
+    def respond_mirror1_malwaredomains_com(self, path, query, body, scenario):
+        self.send(200, '# Stub malware domains\nmalware.example\n', 'text/plain')
+
+    def respond_www_virustotal_com(self, path, query, body, scenario):
+        report = {
+                  'response_code': 1,
+                  'categories': ['information technology'],
+                  'resolutions': [{'ip_address': '192.0.2.{}'.format(number), 'last_resolved': '2019-01-01 00:00:00'} for number in range(1, 4)],
+                  'detected_urls': [],
+                  'detected_downloaded_samples': [],
+                  'undetected_urls': [['http://{}/'.format(query.get('domain', [''])[0]), 'hash', 0, 70, '2019-01-01 00:00:00']] * 50,
+                 }
+        self.send(200, json.dumps(report), 'application/json')
+
+    def respond_cymon_io(self, path, query, body, scenario):
+        self.send(200, 'IP Not Found')
+
+    def respond_talosintelligence_com(self, path, query, body, scenario):
+        self.send(200, json.dumps({'category': {'description': 'Computers and Internet'}}), 'application/json')
+
+    def respond_api_xforce_ibmcloud_com(self, path, query, body, scenario):
+        self.send(200, json.dumps({'result': {'cats': {'Software / Hardware': True}}}), 'application/json')
+
+    def respond_fortiguard_com(self, path, query, body, scenario):
+        self.send(200, read_fixture('fortiguard.html'))
+
+    def respond_sitereview_bluecoat_com(self, path, query, body, scenario):
+        if path == '/resource/captcha.jpg':
+            return self.send(200, b'\xff\xd8\xff\xd9', 'image/jpeg')
+        if path.startswith('/resource/captcha-request/'):
+            return self.send(200, '{}', 'application/json')
+        if scenario == 'captcha':
+            return self.send(200, '<CategorizationResult><categorization><categorization><name>captcha</name>'
+                             '</categorization></categorization></CategorizationResult>', 'application/xml')
+        self.send(200, read_fixture('bluecoat.xml'), 'application/xml')
+
+    def respond_mxtoolbox_com(self, path, query, body, scenario):
+        if self.command == 'GET':
+            return self.send(200, read_fixture('mxtoolbox_form.html'))
+        self.send(200, read_fixture('mxtoolbox.html'))
+
+    def respond_domain_opendns_com(self, path, query, body, scenario):
+        self.send(200, read_fixture('opendns.html'))
+
+    def respond_global_sitesafety_trendmicro_com(self, path, query, body, scenario):
+        if path == '/result.php' and scenario == 'captcha':
+            return self.send(302, headers={'Location': '/global.sitesafety.trendmicro.com/captcha.php'})
+        if path == '/captcha.php':
+            return self.send(200, '<html><body>Please verify you are a human</body></html>')
+        self.send(200, read_fixture('trendmicro.html'))
+
+
+class StubReputationServer(ThreadingHTTPServer):
+    """Threaded HTTP server imitating every reputation source."""
+    daemon_threads = True
+
+    def __init__(self, port=0, delay=0.0, slow_delay=2.0):
+        """Everything that needs to be setup when a new StubReputationServer object is created goes here.
+
+        Parameters:
+
+        port            Defaults to any free port. The local port to listen on.
+        delay           Defaults to 0. Seconds to wait before every normal response.
+        slow_delay      Defaults to 2. Seconds to wait before responses for `slow-` domains.
+        """
+        super().__init__(('127.0.0.1', port), StubRequestHandler)
+        self.delay = delay
+        self.slow_delay = slow_delay
+        self.requests = {}
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL to use as the transport's `stub_url`."""
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def scenario(self, text):
+        """Return the scenario selected by the domain name in the request text, if any."""
+        for scenario in SCENARIOS:
+            if scenario + '-' in text:
+                return scenario
+        return None
+
+    def count(self, host):
+        """Count a request for the host."""
+        with self.lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+
+    def first_request(self, host, text):
+        """Return True the first time a request with this host and text is seen."""
+        with self.lock:
+            if (host, text) in self.seen:
+                return False
+            self.seen.add((host, text))
+            return True
+
+    def start(self):
+        """Serve requests in a background thread and return the server."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests and close the socket."""
+        self.shutdown()
+        self.server_close()
+
+
+class StubProxyHandler(BaseHTTPRequestHandler):
+    """Request handler that forwards plain HTTP proxy requests to their target."""
+    protocol_version = 'HTTP/1.1'
+    # Headers that only apply to a single connection and are not forwarded
+    hop_by_hop = ('connection', 'keep-alive', 'proxy-authorization', 'proxy-connection', 'te', 'trailer',
+                  'transfer-encoding', 'upgrade')
+
+    def log_message(self, format, *args):
+        """Keep the stub quiet."""
+        pass
+
+    def do_GET(self):
+        self.forward(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.forward(self.rfile.read(length))
+
+    def forward(self, body):
+        """Send the request to its target and relay the response."""
+        parts = urlsplit(self.path)
+        headers = {name: value for name, value in self.headers.items() if name.lower() not in self.hop_by_hop}
+        if self.server.captcha:
+            headers['X-Stub-Scenario'] = 'captcha'
+        self.server.count()
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        try:
+            connection.request(self.command, parts.path + ('?' + parts.query if parts.query else ''), body=body, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+        finally:
+            connection.close()
+        self.send_response(response.status)
+        for name, value in response.getheaders():
+            if name.lower() not in self.hop_by_hop and name.lower() != 'content-length':
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class StubProxyServer(ThreadingHTTPServer):
+    """Threaded HTTP server standing in for an outbound proxy."""
+    daemon_threads = True
+
+    def __init__(self, port=0, captcha=False):
+        """Everything that needs to be setup when a new StubProxyServer object is created goes here.
+
+        Parameters:
+
+        port            Defaults to any free port. The local port to listen on.
+        captcha         Defaults to False. Set to True to make Bluecoat and TrendMicro answer
+                        every request forwarded by this proxy with a CAPTCHA.
+        """
+        super().__init__(('127.0.0.1', port), StubProxyHandler)
+        self.captcha = captcha
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        """The proxy URL to add to a ProxyPool."""
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def count(self):
+        """Count a forwarded request."""
+        with self.lock:
+            self.requests += 1
+
+    def start(self):
+        """Serve requests in a background thread and return the server."""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests and close the socket."""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""This module contains the HTTP transport shared by every DomainReview in a process. It wraps a
+`requests.Session` with a connection pool for each host, keep-alive, retries with backoff for
+connection errors and gateway errors, default connect and read timeouts, and optional response
+compression. The connection pools are blocking, so the threads of a review never open more
+connections to a host than the pool allows.
+
+The transport also keeps statistics for each source: the number of requests, the connections
+opened and reused, and the bytes received. Each process builds its own transport, so Django Q
+workers never share sockets inherited from their parent process.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+# Tracks which source the current thread is sending a request for
+current_request = threading.local()
+
+
+def count_new_connection():
+    """Record a newly opened connection for the source the current thread is requesting."""
+    transport = getattr(current_request, 'transport', None)
+    if transport:
+        transport.record(getattr(current_request, 'source', None), opened=1)
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """HTTP connection pool that counts the connections it opens."""
+
+    def _new_conn(self):
+        count_new_connection()
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPS connection pool that counts the connections it opens."""
+
+    def _new_conn(self):
+        count_new_connection()
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter that uses the counting connection pools."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': CountingHTTPConnectionPool,
+                                                   'https': CountingHTTPSConnectionPool}
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        manager.pool_classes_by_scheme = {'http': CountingHTTPConnectionPool,
+                                          'https': CountingHTTPSConnectionPool}
+        return manager
+
+
+class Transport(object):
+    """Class to send the web requests for the reputation sources."""
+
+    def __init__(self, stub_url=None):
+        """Everything that needs to be setup when a new Transport object is created goes here.
+
+        Parameters:
+
+        stub_url        Defaults to the `stub_url` transport setting. The base URL of a
+                        StubReputationServer to send every request to instead of the real sources.
+        """
+        # Try to get the transport options from settings
+        try:
+            options = dict(settings.DOMAINCHECK_CONFIG['transport'])
+        except Exception as error:
+            options = {}
+        self.stub_url = stub_url or options.get('stub_url')
+        self.connect_timeout = options.get('connect_timeout', 10)
+        self.read_timeout = options.get('read_timeout', 30)
+        retries = Retry(total=options.get('retries', 2),
+                        backoff_factor=options.get('backoff_factor', 0.5),
+                        # 429 and 503 are handled by each source's circuit breaker instead, so a
+                        # Retry-After header must not make urllib3 retry them before the caller
+                        # sees the response
+                        status_forcelist=(500, 502, 504),
+                        allowed_methods=frozenset(['GET', 'HEAD']),
+                        raise_on_status=False,
+                        respect_retry_after_header=False)
+        adapter = PooledAdapter(pool_connections=options.get('pool_hosts', 20),
+                                pool_maxsize=options.get('pool_size', 10),
+                                pool_block=True,
+                                max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if options.get('compression', True):
+            self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        else:
+            self.session.headers['Accept-Encoding'] = 'identity'
+        self.stats = OrderedDict()
+        self.stats_lock = threading.Lock()
+
+    def record(self, source, requests_sent=0, opened=0, received=0):
+        """Add to the named source's statistics."""
+        with self.stats_lock:
+            stats = self.stats.setdefault(source or 'other', {'requests': 0, 'opened': 0, 'bytes': 0})
+            stats['requests'] += requests_sent
+            stats['opened'] += opened
+            stats['bytes'] += received
+
+    def request(self, source, method, url, timeout=None, **kwargs):
+        """Send a web request for the named source and return the response. The response body is
+        read before returning, so the connection goes back to its pool right away.
+
+        Parameters:
+
+        source          The name of the source making the request (e.g. talos)
+        method          The HTTP method to use
+        url             The URL to request
+        timeout         Defaults to the transport's connect and read timeouts. A single number
+                        is used as the read timeout.
+        """
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (min(self.connect_timeout, timeout), timeout)
+        if self.stub_url:
+            parts = urlsplit(url)
+            url = '{}/{}{}'.format(self.stub_url.rstrip('/'), parts.netloc, parts.path or '/')
+            if parts.query:
+                url += '?' + parts.query
+        current_request.transport = self
+        current_request.source = source
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            content = response.content
+        finally:
+            current_request.transport = None
+        # The raw byte count is what was sent over the wire before decompression
+        try:
+            received = response.raw.tell() or len(content)
+        except Exception:
+            received = len(content)
+        self.record(source, requests_sent=1, received=received)
+        return response
+
+    def get_stats(self):
+        """Return a copy of the statistics for each source, including the number of requests that
+        reused an open connection.
+        """
+        with self.stats_lock:
+            stats = OrderedDict()
+            for source, counts in self.stats.items():
+                stats[source] = dict(counts, reused=max(0, counts['requests'] - counts['opened']))
+            return stats
+
+    def print_stats(self):
+        """Print the statistics for each source."""
+        for source, counts in self.get_stats().items():
+            print('[*] {}: {} requests, {} connections opened, {} reused, {:.1f} KB received'.format(
+                  source, counts['requests'], counts['opened'], counts['reused'], counts['bytes'] / 1024))
+
+
+# One transport for each process
+transport = None
+transport_pid = None
+transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Return this process's transport, building it on first use."""
+    global transport, transport_pid
+    with transport_lock:
+        if transport is None or transport_pid != os.getpid():
+            transport = Transport()
+            transport_pid = os.getpid()
+        return transport
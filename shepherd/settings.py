@@ -133,8 +133,16 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # Defaults to None, meaning it will never time out. Can be overridden for individual tasks. Not
 # set globally here because DNS and health checks can take a long time and will be different
 # for everyone.
+
+# name: Each cluster only takes tasks from the queue named after it. Set the Q_CLUSTER_NAME
+# environment variable to start a second cluster for the queue named by `recheck_cluster`.
+
+# scheduler: Only the main `shepherd` cluster queues the scheduled tasks, so a second cluster
+# never queues the bulk checks on its own queue.
+Q_CLUSTER_NAME = os.environ.get('Q_CLUSTER_NAME', 'shepherd')
 Q_CLUSTER = {
-    'name': 'shepherd',
+    'name': Q_CLUSTER_NAME,
+    'scheduler': Q_CLUSTER_NAME == 'shepherd',
     'recycle': 500,
     'save_limit': 35,
     'queue_limit': 500,
@@ -148,9 +156,115 @@ Q_CLUSTER = {
 
 # DomainCheck configuration
 # Enter a VirusTotal API key (free or paid)
+# virustotal_api_keys: A list of additional VirusTotal API keys. Requests are spread across every
+# key, the `virustotal` rate limit applies to each key, and a key that is refused or hits its
+# daily quota is skipped for `virustotal_quarantine` minutes (a throttled key is only paused briefly)
+# virustotal_daily_quota: Requests each VirusTotal API key may make per day (None for no limit)
+# virustotal_resolutions: Most recent passive DNS resolutions kept from each VirusTotal report. Each
+# resolution's IP address is looked up separately.
+# max_workers: Number of domains reviewed at the same time by each Django Q worker
+# shard_size: Number of domains in each task when an update is split across Django Q workers
+# lease_time: Minutes a task may hold a domain without renewing its lease before another task is allowed to check it
+# chunk_size: Number of domains loaded from the database at a time during a review
+# rate_limits: Requests allowed for each source (e.g. 4/min, 1/20s, 100/hour). Sources left out
+# are not limited. If `virustotal` is left out, the older `sleep_time` setting (seconds between
+# VirusTotal requests) is used instead.
+# shared_rate_limits: Keep the rate limit buckets in the database, so `rate_limits` (and each proxy's
+# and VirusTotal key's limits) apply to every Django Q worker together instead of to each worker
+# malwaredomains_path: Where to save the malwaredomains.com list between runs (defaults to
+# malwaredomains.txt in the project directory)
+# sources: Per-source overrides for `timeout` (seconds), `concurrency` (lookups at the same time),
+# and `enabled` (checked by default). Source names: virustotal, cymon, xforce, talos, bluecoat,
+# fortiguard, opendns, trendmicro, mxtoolbox
+# cache_ttl: Hours to reuse each source's results before querying it again. Sources left out or
+# set to 0 are always queried. The `bluecoat_session` entry is how long the cookies of a session
+# with a solved Bluecoat CAPTCHA are reused.
+# breaker_threshold: Consecutive failed lookups (e.g. CAPTCHAs, errors, or used up quotas) before
+# a source is skipped for the rest of the run and its results are marked as not checked
+# max_retries: Times to retry a request after a 429 or 503 response, backing off between retries
+# ocr_workers: Number of processes used to read Bluecoat CAPTCHAs with Tesseract
+# ocr_timeout: Seconds to wait for a CAPTCHA to be read
+# transport: Options for the pooled HTTP connections shared by the sources. `pool_hosts` is the
+# number of hosts kept in the pool, `pool_size` the connections kept for each host, `retries` and
+# `backoff_factor` control retries of connection errors and 500/502/504 responses for GET
+# requests, `connect_timeout` and `read_timeout` are in seconds (a source's own `timeout` is its
+# read timeout), `compression` asks for gzip or deflate encoded responses, and `stub_url` sends every
+# request to a local StubReputationServer (modules/stub.py) instead of the real sources
+# archive_responses: Store each raw source response compressed, so `manage.py reparse_archive` can
+# rebuild categories and health after a parser fix without sending any web requests
+# archive_retention: Days to keep archived responses (the newest response for each lookup is always kept)
+# repair_backoff: Minutes to wait before retrying a failed source lookup from the repair queue. The
+# wait doubles after every failed retry, up to a day.
+# repair_attempts: Retries of a failed source lookup before it is left for the next full run
+# proxies: Outbound HTTP proxies for the scraped sources. `urls` lists the proxies, `sources` names
+# the sources sent through them, and each source's `rate_limits` entry applies to each proxy. A
+# proxy that triggers `captcha_limit` CAPTCHAs in a row for a source is not used for that source
+# for `bench_time` minutes. Requests are sent directly when no proxy is usable.
+# recheck_cluster: None queues "Recheck Now" requests with every other task. Set it to the name of a
+# second Django Q cluster (e.g. 'shepherd-priority') and start that cluster with
+# `Q_CLUSTER_NAME=shepherd-priority python3 manage.py qcluster` so rechecks don't wait behind bulk updates.
 DOMAINCHECK_CONFIG = {
     'virustotal_api_key': '',
-    'sleep_time': 20,
+    'virustotal_api_keys': [],
+    'virustotal_daily_quota': None,
+    'virustotal_quarantine': 60,
+    'virustotal_resolutions': 25,
+    'max_workers': 4,
+    'shard_size': 25,
+    'lease_time': 120,
+    'chunk_size': 100,
+    'breaker_threshold': 5,
+    'max_retries': 3,
+    'shared_rate_limits': True,
+    'ocr_workers': 1,
+    'ocr_timeout': 30,
+    'archive_responses': False,
+    'archive_retention': 30,
+    'repair_backoff': 5,
+    'repair_attempts': 6,
+    'recheck_cluster': None,
+    'proxies': {
+        'urls': [],
+        'sources': ['bluecoat', 'trendmicro', 'opendns', 'fortiguard', 'mxtoolbox'],
+        'captcha_limit': 2,
+        'bench_time': 30,
+    },
+    'transport': {
+        'pool_hosts': 20,
+        'pool_size': 10,
+        'retries': 2,
+        'backoff_factor': 0.5,
+        'connect_timeout': 10,
+        'read_timeout': 30,
+        'compression': True,
+    },
+    'rate_limits': {
+        'virustotal': '4/min',
+        'cymon': '60/min',
+        'talos': '30/min',
+        'xforce': '30/min',
+        'bluecoat': '10/min',
+        'fortiguard': '30/min',
+        'opendns': '30/min',
+        'trendmicro': '15/min',
+        'mxtoolbox': '10/min',
+    },
+    'sources': {
+        'bluecoat': {'timeout': 30, 'concurrency': 1, 'enabled': True},
+        'trendmicro': {'timeout': 30, 'concurrency': 2, 'enabled': True},
+    },
+    'cache_ttl': {
+        'virustotal': 12,
+        'cymon': 24,
+        'talos': 168,
+        'xforce': 168,
+        'bluecoat': 168,
+        'fortiguard': 168,
+        'opendns': 168,
+        'trendmicro': 168,
+        'mxtoolbox': 24,
+        'bluecoat_session': 4,
+    },
 }
 
 # Slack configuration
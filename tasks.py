@@ -2,19 +2,46 @@
 
 # Import the catalog application's models and settings
 from django.conf import settings
-from catalog.models import Domain, History, DomainStatus, HealthStatus
+from django.utils import timezone
+from django.db.models import Q, F, Case, When, Value, IntegerField
+from catalog.models import Domain, History, DomainStatus, HealthStatus, ReviewRun, LookupRepair, Category
+
+# Django Q imports for task management
+from django_q.tasks import async_task
+from django_q.brokers import get_broker
+from django_q.signals import pre_execute
+from django.dispatch import receiver
 
 # Import custom modules
 from modules.review import DomainReview
+from modules.sources import SOURCES
+from modules.breaker import NOT_CHECKED
 from modules.dns import DNSCollector
+from modules.categories import BLACKLISTED, save_domain_categories, get_blacklisted_domains
+from modules.history import record_result_changes, get_domain_results
 
 # Import Python libraries for various things
 import json
+import uuid
 import requests
+import time
 import datetime
 from datetime import date
 
 
+# The Django Q task running in this worker process, so a retried task can resume its own run
+current_task = {}
+
+@receiver(pre_execute)
+def remember_current_task(sender, func, task, **kwargs):
+    """Record the ID of the Django Q task that is about to run in this worker process."""
+    current_task.clear()
+    current_task['id'] = task.get('id')
+
+# Seconds a recheck waits for another task to release the domain's lease
+RECHECK_LEASE_WAIT = 60
+
+
 def send_slack_msg(message):
     """Accepts message text and sends it to Slack. This requires Slack settings and a webhook be
     configured in the application's settings.
@@ -95,39 +122,528 @@ def release_domains(no_action=False):
             domain_instance.save()
         return domains_to_be_released
 
-def check_domains():
-    """Initiate a check of all domains in the Domain model and update each domain status."""
-    # Get all domains from the database
-    domain_queryset = Domain.objects.all()
-    domain_review = DomainReview(domain_queryset)
-    lab_results = domain_review.check_domain_status()
-    for domain in lab_results:
+def get_domains_to_check(max_age=None, limit=None):
+    """Return a queryset of the domains that should be checked, most important first. Domains that
+    are `Available` or `Reserved` come first, then `Unavailable` domains, and within each group
+    the domains that have gone the longest without a check come first.
+
+    Domains known to be burned are skipped. This just saves time and operators can edit a domain
+    and set status to `Healthy` as needed. The domain will be included in the next update after
+    the edit.
+
+    Parameters:
+
+    max_age         Defaults to None. Set to a number of hours to only select domains that have
+                    not been checked within that many hours.
+    limit           Defaults to None. Set to the maximum number of domains to select.
+    """
+    queryset = Domain.objects.exclude(health_status__health_status='Burned')
+    if max_age is not None:
+        cutoff = timezone.now() - datetime.timedelta(hours=float(max_age))
+        queryset = queryset.filter(Q(last_checked__isnull=True) | Q(last_checked__lt=cutoff))
+    queryset = queryset.annotate(check_priority=Case(
+                                    When(domain_status__domain_status__in=['Available', 'Reserved'], then=Value(0)),
+                                    When(domain_status__domain_status='Unavailable', then=Value(1)),
+                                    default=Value(2),
+                                    output_field=IntegerField())
+                                ).order_by('check_priority', F('last_checked').asc(nulls_first=True), 'name')
+    if limit:
+        queryset = queryset[:int(limit)]
+    return queryset
+
+def update_domain_health(domain, results, checked=True):
+    """Save the results of a DomainReview for one domain and send a Slack message if the domain
+    was flagged as burned.
+
+    Parameters:
+
+    domain          The Domain object that was reviewed
+    results         The dictionary returned for the domain by DomainReview
+    checked         Defaults to True. Set to False to leave the domain's `last_checked` time
+                    alone, such as when the results were parsed again from archived responses.
+    """
+    try:
+        # Fetch a fresh copy so changes made while the review was running are not overwritten
+        domain_instance = Domain.objects.get(name=domain.name)
+        # Flip status if a domain has been flagged as burned
+        if results['burned']:
+            domain_instance.health_status = HealthStatus.objects.get(health_status='Burned')
+            domain_instance.domain_status = DomainStatus.objects.get(domain_status='Burned')
+            message = '*{}* has been flagged as burned because: {}'.format(domain.name, results['burned_explanation'])
+            if results['categories']['bad']:
+                message = message + ' (Bad categories: {})'.format(results['categories']['bad'])
+            send_slack_msg(message)
+        # Update other fields for the domain object
+        if results['health_dns'] is not None:
+            domain_instance.health_dns = results['health_dns']
+        domain_instance.burned_explanation = results['burned_explanation']
+        domain_instance.all_cat = results['categories']['all']
+        # Sources that were not part of the run have no results, so their stored values are kept
+        for name, source in SOURCES.items():
+            if source.field and results['categories'].get(name) is not None:
+                setattr(domain_instance, source.field, results['categories'][name])
+        if checked:
+            domain_instance.last_checked = timezone.now()
+        domain_instance.save()
+        # Link the domain to each source's categories for indexed searches and burned checks
+        for name, source in SOURCES.items():
+            if source.field and source.categorizes and results['categories'].get(name) is not None:
+                save_domain_categories(domain_instance, name, results['categories'][name])
+        if results['categories'].get('virustotal') is not None:
+            save_domain_categories(domain_instance, 'virustotal', results['categories']['virustotal'])
+        # Keep a history of the results that changed
+        record_result_changes(domain_instance, get_domain_results(domain_instance))
+    except Exception as error:
+        print('[!] Error updating "{}". Error: {}'.format(domain.name, error))
+
+def flag_blacklisted_domains():
+    """Flag every domain that a source tagged with a blacklisted category as burned. This only
+    queries the database, so run it after adding a category or an alias to the blacklist in the
+    admin panel instead of checking every domain again.
+    """
+    burned_health = HealthStatus.objects.get(health_status='Burned')
+    burned_status = DomainStatus.objects.get(domain_status='Burned')
+    flagged = 0
+    for domain in get_blacklisted_domains(Domain.objects.exclude(health_status=burned_health)):
+        # Keep the bad categories found by the last check, such as those from VirusTotal
+        bad_categories = [category for category in (domain.all_cat or '').split(', ') if category]
+        for category in Category.objects.filter(BLACKLISTED, domain_links__domain=domain).distinct():
+            if category.name.capitalize() not in bad_categories:
+                bad_categories.append(category.name.capitalize())
+        explanations = [explanation for explanation in (domain.burned_explanation or '').split(', ') if explanation]
+        if 'Tagged with a bad category' not in explanations:
+            explanations.append('Tagged with a bad category')
+        domain.health_status = burned_health
+        domain.domain_status = burned_status
+        domain.burned_explanation = ', '.join(explanations)
+        domain.all_cat = ', '.join(bad_categories)
+        domain.save()
+        record_result_changes(domain, get_domain_results(domain))
+        send_slack_msg('*{}* has been flagged as burned because: {} (Bad categories: {})'.format(
+                       domain.name, domain.burned_explanation, domain.all_cat))
+        flagged += 1
+    return 'Flagged {} domains tagged with blacklisted categories'.format(flagged)
+
+def get_repair_delay(attempts):
+    """Return how long to wait before retrying a failed lookup that has already been retried
+    the provided number of times. The `repair_backoff` setting (minutes) doubles with every
+    attempt, up to a day.
+    """
+    try:
+        repair_backoff = settings.DOMAINCHECK_CONFIG['repair_backoff']
+    except:
+        repair_backoff = 5
+    return datetime.timedelta(minutes=min(float(repair_backoff) * 2 ** attempts, 1440))
+
+def queue_lookup_repairs(domain, results):
+    """Add each source whose lookup failed in the domain's review to the repair queue and remove
+    the sources that were checked successfully.
+
+    Parameters:
+
+    domain          The Domain object that was reviewed
+    results         The dictionary returned for the domain by DomainReview
+    """
+    failed = []
+    succeeded = []
+    for name, value in results['categories'].items():
+        # VirusTotal is judged by the passive DNS health below
+        if name in SOURCES and name != 'virustotal' and value is not None:
+            if value == NOT_CHECKED:
+                failed.append(name)
+            else:
+                succeeded.append(name)
+    # VirusTotal's results show up in the passive DNS health
+    if results['health_dns'] == NOT_CHECKED:
+        failed.append('virustotal')
+    elif results['health_dns'] is not None:
+        succeeded.append('virustotal')
+    try:
+        now = timezone.now()
+        for name in failed:
+            repair, created = LookupRepair.objects.get_or_create(domain_id=domain.id, source=name, defaults={
+                                                                 'failed': now, 'next_attempt': now + get_repair_delay(0)})
+            if not created:
+                repair.attempts += 1
+                repair.failed = now
+                repair.next_attempt = now + get_repair_delay(repair.attempts)
+                repair.save()
+        if succeeded:
+            LookupRepair.objects.filter(domain_id=domain.id, source__in=succeeded).delete()
+    except Exception as error:
+        print('[!] Error queuing lookup repairs for "{}". Error: {}'.format(domain.name, error))
+
+def merge_repaired_results(domain, results):
+    """Return the results of a review limited to a domain's failed sources with the domain's
+    stored bad categories and health explanations added back. `update_domain_health()` replaces
+    those fields, and the sources that were not retried still stand behind them.
+
+    Parameters:
+
+    domain          The Domain object that was reviewed
+    results         The dictionary returned for the domain by DomainReview
+    """
+    def merge(stored, new):
+        values = [value for value in (stored or '').split(', ') if value]
+        for value in new.split(', '):
+            if value and value not in values:
+                values.append(value)
+        return ', '.join(values)
+    results = dict(results, categories=dict(results['categories']))
+    results['categories']['all'] = merge(domain.all_cat, results['categories']['all'])
+    results['burned_explanation'] = merge(domain.burned_explanation, results['burned_explanation'])
+    return results
+
+def get_lease_expiry():
+    """Return when a domain lease taken or renewed now expires, based on the `lease_time` setting."""
+    try:
+        lease_time = settings.DOMAINCHECK_CONFIG['lease_time']
+    except:
+        lease_time = 120
+    return timezone.now() + datetime.timedelta(minutes=lease_time)
+
+def acquire_domain_leases(domain_ids, owner):
+    """Lease the provided domains to the named owner so no other task checks them at the same
+    time. Domains already leased by another owner are skipped unless that lease has expired.
+    Returns the list of IDs that were leased.
+
+    Parameters:
+
+    domain_ids      A list of Domain IDs
+    owner           A unique ID for the task taking the leases
+    """
+    # A single UPDATE is atomic, so two tasks can never take the same domain
+    Domain.objects.filter(id__in=domain_ids).filter(Q(lease_expires__isnull=True) | Q(lease_expires__lt=timezone.now())).update(
+        lease_owner=owner, lease_expires=get_lease_expiry())
+    return list(Domain.objects.filter(id__in=domain_ids, lease_owner=owner).values_list('id', flat=True))
+
+def renew_domain_leases(owner):
+    """Extend every domain lease still held by the named owner by another `lease_time`."""
+    Domain.objects.filter(lease_owner=owner).update(lease_expires=get_lease_expiry())
+
+def release_domain_leases(owner):
+    """Release every domain lease held by the named owner."""
+    Domain.objects.filter(lease_owner=owner).update(lease_owner=None, lease_expires=None)
+
+class LeasedDomainReview(DomainReview):
+    """DomainReview that leases each chunk of domains just before reviewing it, instead of
+    leasing the whole run up front. The leases still held are renewed with each chunk, so a run
+    that takes longer than `lease_time` never loses the domains it is working on, and domains
+    the run has not reached yet can be checked by a recheck in the meantime.
+    """
+
+    def __init__(self, *args, owner=None, **kwargs):
+        """Everything that needs to be setup when a new LeasedDomainReview object is created goes here.
+
+        Parameters:
+
+        owner           A unique ID for the task taking the leases
+        """
+        super().__init__(*args, **kwargs)
+        self.owner = owner
+
+    def domain_chunks(self):
+        """Yield the domains of each chunk that could be leased. Domains leased by another task
+        are skipped.
+        """
+        for chunk in super().domain_chunks():
+            renew_domain_leases(self.owner)
+            leased_ids = set(acquire_domain_leases([domain.id for domain in chunk], self.owner))
+            if len(leased_ids) < len(chunk):
+                print('[*] Skipping {} domains already being checked by another task.'.format(len(chunk) - len(leased_ids)))
+            yield [domain for domain in chunk if domain.id in leased_ids]
+
+def get_review_run(name, domain_ids, options):
+    """Return the checkpoint for the named run, creating it if this is the run's first attempt.
+    A run that already exists with the same options keeps its original domains, so a retried
+    task picks up where the last attempt stopped. If the options differ, the run starts over.
+
+    Parameters:
+
+    name            A unique name for the run
+    domain_ids      A list of Domain IDs selected for the run
+    options         A dictionary of the run's options (e.g. the sources to check)
+    """
+    # Compare the options the way they are stored
+    options = json.loads(json.dumps(options))
+    run, created = ReviewRun.objects.get_or_create(name=name, defaults={
+                                                   'domain_ids': json.dumps(domain_ids),
+                                                   'options': json.dumps(options),
+                                                   'started': timezone.now()})
+    if created:
+        return run
+    if json.loads(run.options) != options:
+        print('[*] Run {} was started with different options, so it is starting over.'.format(run.name))
+        run.domain_ids = json.dumps(domain_ids)
+        run.options = json.dumps(options)
+        run.started = timezone.now()
+        run.finished = None
+        run.checked = 0
+        run.last_domain = None
+        run.deferred = '[]'
+        run.save()
+    else:
+        print('[*] Resuming run {} after {} domains were already checked.'.format(run.name, run.checked))
+    return run
+
+def review_domains(domain_ids, force_refresh=False, sources=None, run_name=None, time_budget=None, options=None):
+    """Lease, review, and update the provided domains. Each domain's results are saved as soon
+    as its review finishes and the run's checkpoint is updated, so if the run is interrupted
+    the next attempt with the same `run_name` only reviews the domains that are left. Returns
+    the number of domains checked.
+
+    If the time budget runs out, the domains that were not started are recorded as deferred
+    and the run is finished. They have not been checked, so the next `check_domains` run picks
+    them up before the domains that were.
+
+    Parameters:
+
+    domain_ids      A list of Domain IDs
+    force_refresh   Defaults to False. Set to True to ignore cached source results and query
+                    every source again.
+    sources         Defaults to None. A list of source names to limit the review to. Every
+                    enabled source is checked when not provided.
+    run_name        Defaults to a new name. The name of the run's checkpoint.
+    time_budget     Defaults to None. Minutes the review may run before it stops starting
+                    new domains.
+    options         Defaults to the `force_refresh` and `sources` arguments. The options saved
+                    with the run, which must match for a retried run to resume.
+    """
+    if not run_name:
+        run_name = 'Domain Check {}'.format(uuid.uuid4().hex)
+    if options is None:
+        options = {'force_refresh': force_refresh, 'sources': sources}
+    run = get_review_run(run_name, domain_ids, options)
+    # Domains checked after the run started were saved by an earlier attempt
+    domain_ids = list(Domain.objects.filter(id__in=json.loads(run.domain_ids)).filter(
+                      Q(last_checked__isnull=True) | Q(last_checked__lt=run.started)).values_list('id', flat=True))
+    owner = uuid.uuid4().hex
+    checked = 0
+    try:
+        # Keep the priority order from `get_domains_to_check()`
+        domain_queryset = get_domains_to_check().filter(id__in=domain_ids)
+        if time_budget is not None:
+            time_budget = float(time_budget) * 60
+        # Each chunk of domains is leased as the review reaches it
+        domain_review = LeasedDomainReview(domain_queryset, force_refresh=force_refresh, sources=sources,
+                                           time_budget=time_budget, owner=owner)
+        for domain, results in domain_review.stream_domain_status():
+            update_domain_health(domain, results)
+            queue_lookup_repairs(domain, results)
+            ReviewRun.objects.filter(id=run.id).update(checked=F('checked') + 1, last_domain=domain.name)
+            # A recheck of a domain that was just saved doesn't have to wait for the whole shard
+            Domain.objects.filter(id=domain.id, lease_owner=owner).update(lease_owner=None, lease_expires=None)
+            checked += 1
+        # A run that used its time budget is finished too, with the domains it left listed
+        ReviewRun.objects.filter(id=run.id).update(finished=timezone.now(), deferred=json.dumps(domain_review.deferred))
+        if domain_review.deferred:
+            send_slack_msg('Run {} used its time budget after checking {} domains. These {} domains were deferred to the next run: {}'.format(
+                           run.name, checked, len(domain_review.deferred), ', '.join(domain_review.deferred)))
+    finally:
+        release_domain_leases(owner)
+    return checked
+
+def check_domains(force_refresh=False, max_age=None, limit=None, sources=None, resume=True, time_budget=None):
+    """Initiate a check of the domains in the Domain model and update each domain status. By
+    default every domain that is not burned is checked. Use `max_age` and `limit` for small,
+    frequent runs that only refresh the domains that are due for a check.
+
+    The run is named after the Django Q task running it, so if Django Q retries the task after
+    it was interrupted, the retry resumes the run with its original domains. Every other call
+    starts a new run.
+
+    Parameters:
+
+    force_refresh   Defaults to False. Set to True to ignore cached source results and query
+                    every source again.
+    max_age         Defaults to None. Set to a number of hours to only check domains that have
+                    not been checked within that many hours.
+    limit           Defaults to None. Set to the maximum number of domains to check in this run.
+    sources         Defaults to None. A list of source names to limit the run to (e.g.
+                    ['virustotal', 'talos']). Every enabled source is checked when not provided.
+    resume          Defaults to True. Set to False to start a new run even if the task is retried.
+    time_budget     Defaults to None. Minutes the run may take (e.g. 45). Domains are started
+                    in priority order while they are expected to finish in time and the rest
+                    are deferred to the next run.
+    """
+    options = {'force_refresh': force_refresh, 'max_age': max_age, 'limit': limit, 'sources': sources,
+               'time_budget': time_budget}
+    task_id = current_task.get('id') if resume else None
+    if task_id:
+        run_name = 'Domain Check {}'.format(task_id)
+    else:
+        run_name = 'Domain Check {} {}'.format(timezone.now().strftime('%Y-%m-%d %H:%M:%S'), uuid.uuid4().hex[:8])
+    run = ReviewRun.objects.filter(name=run_name).first()
+    if run and json.loads(run.options) == json.loads(json.dumps(options)):
+        # A retry of this task keeps the domains selected by the first attempt
+        domain_ids = json.loads(run.domain_ids)
+    else:
+        # Get the domains that are due for a check from the database
+        domain_ids = list(get_domains_to_check(max_age=max_age, limit=limit).values_list('id', flat=True))
+    review_domains(domain_ids, force_refresh=force_refresh, sources=sources, run_name=run_name,
+                   time_budget=time_budget, options=options)
+
+def repair_failed_lookups(limit=None):
+    """Retry the failed source lookups in the repair queue that are due and merge the results
+    into each domain's stored results. Only the sources that failed are queried, so this is
+    cheap enough to schedule every few minutes. Lookups that fail again wait longer before the
+    next retry and are given up after `repair_attempts` retries (until a full run checks the
+    source successfully).
+
+    Parameters:
+
+    limit           Defaults to None. Set to the maximum number of failed lookups to retry.
+    """
+    try:
+        repair_attempts = settings.DOMAINCHECK_CONFIG['repair_attempts']
+    except:
+        repair_attempts = 6
+    due = LookupRepair.objects.filter(next_attempt__lte=timezone.now(), attempts__lt=repair_attempts).order_by('next_attempt')
+    if limit:
+        due = due[:int(limit)]
+    repair_ids = []
+    failed_sources = {}
+    for repair in due:
+        repair_ids.append(repair.id)
+        failed_sources.setdefault(repair.domain_id, set()).add(repair.source)
+    # Domains that failed on the same sources are retried together in one review
+    groups = {}
+    for domain_id, names in failed_sources.items():
+        # Passive DNS health needs the IP address lookups as well as VirusTotal
+        if 'virustotal' in names:
+            names.add('cymon')
+        groups.setdefault(tuple(sorted(names)), []).append(domain_id)
+    owner = uuid.uuid4().hex
+    try:
+        for names, domain_ids in groups.items():
+            domain_review = LeasedDomainReview(Domain.objects.filter(id__in=domain_ids), sources=list(names), owner=owner)
+            for domain, results in domain_review.stream_domain_status():
+                update_domain_health(domain, merge_repaired_results(domain, results), checked=False)
+                queue_lookup_repairs(domain, results)
+    finally:
+        release_domain_leases(owner)
+    repaired = len(repair_ids) - LookupRepair.objects.filter(id__in=repair_ids).count()
+    return 'Repaired {} of {} failed lookups'.format(repaired, len(repair_ids))
+
+def recheck_domain(domain_id, sources=None):
+    """Review one domain right away and save its results. Cached source results are ignored, so
+    the verdict is fresh. Meant to be queued with `queue_domain_recheck()` when an operator is
+    about to use the domain. The domain is leased like any other check, so a recheck never runs
+    at the same time as a shard checking the same domain.
+
+    Parameters:
+
+    domain_id       The ID of the Domain to review
+    sources         Defaults to None. A list of source names to limit the review to. Every
+                    enabled source is checked when not provided.
+    """
+    if not Domain.objects.filter(id=domain_id).exists():
+        return 'Domain {} was not found'.format(domain_id)
+    # Wait for a shard that is checking the domain right now to save it and release its lease
+    owner = uuid.uuid4().hex
+    waited = 0
+    while not acquire_domain_leases([domain_id], owner):
+        if waited >= RECHECK_LEASE_WAIT:
+            return 'Domain {} is waiting to be checked by another task, so it was not rechecked'.format(domain_id)
+        time.sleep(2)
+        waited += 2
+    try:
+        domain_review = DomainReview(Domain.objects.filter(id=domain_id), force_refresh=True, sources=sources)
+        for domain, results in domain_review.stream_domain_status():
+            update_domain_health(domain, results)
+            queue_lookup_repairs(domain, results)
+            if results['burned']:
+                return '{} was rechecked and is burned: {}'.format(domain.name, results['burned_explanation'])
+            return '{} was rechecked and is healthy'.format(domain.name)
+    finally:
+        release_domain_leases(owner)
+
+def queue_domain_recheck(domain_id, sources=None):
+    """Queue `recheck_domain()` for one domain and return the task's ID. The task is sent to the
+    queue of the Django Q cluster named by the `recheck_cluster` setting, if one is configured,
+    so it does not wait behind the shards of a bulk update. Otherwise it is queued with every
+    other task.
+
+    Parameters:
+
+    domain_id       The ID of the Domain to review
+    sources         Defaults to None. A list of source names to limit the review to.
+    """
+    try:
+        recheck_cluster = settings.DOMAINCHECK_CONFIG['recheck_cluster']
+    except:
+        recheck_cluster = None
+    # Django Q names each cluster's queue after the cluster
+    broker = get_broker(recheck_cluster) if recheck_cluster else get_broker()
+    return async_task('tasks.recheck_domain', domain_id, sources=sources, group='Domain Rechecks',
+                      hook='tasks.send_slack_complete_msg', broker=broker)
+
+def check_domain_shard(domain_ids, force_refresh=False, sources=None, shard_total=None, run_name=None):
+    """Check one shard of domains queued by `queue_domain_checks()`. The group's finished shards
+    are counted by the `send_group_complete_msg()` hook. If Django Q retries the shard, the
+    `run_name` checkpoint skips the domains already saved.
+
+    Parameters:
+
+    domain_ids      A list of Domain IDs in this shard
+    force_refresh   Defaults to False. Set to True to ignore cached source results and query
+                    every source again.
+    sources         Defaults to None. A list of source names to limit the review to.
+    shard_total     The number of shards in this shard's group (shown in the task's arguments)
+    run_name        Defaults to None. The name of the shard's checkpoint.
+    """
+    checked = review_domains(domain_ids, force_refresh=force_refresh, sources=sources, run_name=run_name)
+    return 'Checked {} of {} domains'.format(checked, len(domain_ids))
+
+def queue_domain_checks(force_refresh=False, max_age=None, limit=None, sources=None, shard_size=None):
+    """Split the domains that are due for a check into shards and queue each shard as its own
+    task, so every Django Q worker can take part in the run. All shards share one group and
+    the group's name is returned.
+
+    Parameters:
+
+    force_refresh   Defaults to False. Set to True to ignore cached source results and query
+                    every source again.
+    max_age         Defaults to None. Set to a number of hours to only check domains that have
+                    not been checked within that many hours.
+    limit           Defaults to None. Set to the maximum number of domains to check in this run.
+    sources         Defaults to None. A list of source names to limit the run to. Every enabled
+                    source is checked when not provided.
+    shard_size      Defaults to the `shard_size` setting. The number of domains in each shard.
+    """
+    if not shard_size:
         try:
-            # The `domain` is already a Domain object so this query might be unnecessary :thinking_emoji:
-            domain_instance = Domain.objects.get(name=domain.name)
-            # Flip status if a domain has been flagged as burned
-            if lab_results[domain]['burned']:
-                domain_instance.health_status = HealthStatus.objects.get(health_status='Burned')
-                domain_instance.domain_status = DomainStatus.objects.get(domain_status='Burned')
-                message = '*{}* has been flagged as burned because: {}'.format(domain.name, lab_results[domain]['burned_explanation'])
-                if lab_results[domain]['categories']['bad']:
-                    message = message + ' (Bad categories: {})'.format(lab_results[domain]['categories']['bad'])
-                send_slack_msg(message)
-            # Update other fields for the domain object
-            domain_instance.health_dns = lab_results[domain]['health_dns']
-            domain_instance.burned_explanation = lab_results[domain]['burned_explanation']
-            domain_instance.all_cat = lab_results[domain]['categories']['all']
-            domain_instance.talos_cat = lab_results[domain]['categories']['talos']
-            domain_instance.opendns_cat = lab_results[domain]['categories']['opendns']
-            domain_instance.bluecoat_cat = lab_results[domain]['categories']['bluecoat']
-            domain_instance.ibm_xforce_cat = lab_results[domain]['categories']['xforce']
-            domain_instance.trendmicro_cat = lab_results[domain]['categories']['trendmicro']
-            domain_instance.fortiguard_cat = lab_results[domain]['categories']['fortiguard']
-            domain_instance.mx_toolbox_status = lab_results[domain]['categories']['mxtoolbox']
-            domain_instance.save()
-        except Exception as error:
-            print('[!] Error updating "{}". Error: {}'.format(domain.name, error))
-            pass
+            shard_size = settings.DOMAINCHECK_CONFIG['shard_size']
+        except:
+            shard_size = 25
+    domain_ids = list(get_domains_to_check(max_age=max_age, limit=limit).values_list('id', flat=True))
+    shards = [domain_ids[index:index + shard_size] for index in range(0, len(domain_ids), shard_size)]
+    # Each run gets its own group, and the group's run counts the finished shards for the hook
+    group = 'Domain Updates {} {}'.format(timezone.now().strftime('%Y-%m-%d %H:%M:%S'), uuid.uuid4().hex[:8])
+    ReviewRun.objects.create(name=group, domain_ids=json.dumps(domain_ids), started=timezone.now(), shards=len(shards),
+                             options=json.dumps({'force_refresh': force_refresh, 'sources': sources}),
+                             finished=None if shards else timezone.now())
+    for number, shard in enumerate(shards, start=1):
+        async_task('tasks.check_domain_shard', shard, force_refresh=force_refresh, sources=sources, shard_total=len(shards),
+                   run_name='{} (shard {})'.format(group, number), group=group, hook='tasks.send_group_complete_msg')
+    return group, len(shards)
+
+def send_group_complete_msg(task):
+    """Function to send a Slack message once every shard in a group queued by
+    `queue_domain_checks()` has finished. Meant to be used as a hook for an async_task().
+    """
+    if not task.success:
+        send_slack_complete_msg(task)
+    # Django Q only keeps `save_limit` successful tasks, so the shards are counted on the group's run
+    ReviewRun.objects.filter(name=task.group).update(shards_finished=F('shards_finished') + 1,
+                                                     shards_failed=F('shards_failed') + (0 if task.success else 1))
+    # Only the hook that counts the last shard marks the run finished, so the message is sent once
+    if ReviewRun.objects.filter(name=task.group, finished__isnull=True, shards_finished__gte=F('shards')).update(finished=timezone.now()):
+        run = ReviewRun.objects.get(name=task.group)
+        message = 'Task group {} has completed its run. {} of {} shards completed successfully.'.format(
+                  task.group, run.shards_finished - run.shards_failed, run.shards)
+        print('[+] ' + message)
+        send_slack_msg(message)
 
 def update_dns():
     """Initiate a check of all domains in the Domain model and update each domain's DNS records."""